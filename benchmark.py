@@ -0,0 +1,723 @@
+#!/usr/bin/env python
+"""
+    Benchmarks for the hot paths of the capture and prep scripts. Everything
+    here runs on synthetic data at the real sizes (full 12-bit RAW frames,
+    live view jpegs) and against canon_sim's simulated camera, so no camera
+    (or Windows) is needed.
+
+    Save a run with -o and pass it to a later run with --compare to see what
+    got slower; anything more than the tolerance slower is flagged and makes
+    the script exit with an error, so it can gate a build.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import argparse
+import cv2
+import ctypes
+import glob
+import json
+import multiprocessing
+import numpy as np
+import os
+import platform
+import subprocess as sp
+import sys
+import time
+import timeit
+
+import canon_cam
+import canon_errors
+import canon_headers as c_hdr
+import canon_overlay
+import canon_helpers as c_hlp
+import canon_liveview
+import canon_sdk as c_sdk
+import canon_sim
+import canon_types
+import metrics
+import prep_geometry
+import prep_image
+import prep_libraw
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+compare     = None # Results of an earlier run (--compare)
+evf_height  = 704  # Size of the live view jpeg the Rebel Xsi sends
+evf_width   = 1056
+raw_height  = 2848 # Size of a full RAW capture from the Rebel Xsi
+raw_width   = 4272
+raw_dir     = None # Directory of RAW files for the decode benchmark
+regressions = []   # Names of the timings slower than in compare
+repeat      = 5    # Number of times each timing is repeated (best is kept)
+results     = {}   # name : { "seconds", "memory" } of everything reported
+tolerance   = 0.1  # How much slower than compare counts as a regression
+verbose     = False
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def ArgParser():
+    """ This function will handle the input arguments while keeping the main
+        function tidy. """
+    global compare, raw_dir, repeat, tolerance, verbose
+
+    usage = """
+    benchmark.py [-r N] [-o FILE] [--compare FILE] [-v] [BENCH ...]
+
+    Time the hot paths of canon_cam.py and prep_image.py on synthetic data.
+    With no BENCH given every benchmark is run.
+
+            """
+
+    parser = argparse.ArgumentParser( description = "Benchmarks",
+                                      usage = usage)
+
+    parser.add_argument( "benches",
+                         nargs   = '*',
+                         action  = "store",
+                         default = [],
+                         help    = "The benchmark(s) to run: %s" % \
+                                   ", ".join(sorted(BENCHES)) )
+
+    parser.add_argument( "--compare",
+                         action  = "store",
+                         default = None,
+                         dest    = "compare",
+                         help    = "Compare with the results saved by an " \
+                                   "earlier run." )
+
+    parser.add_argument( "-o",
+                         action  = "store",
+                         default = None,
+                         dest    = "output",
+                         help    = "Save the results to this JSON file." )
+
+    parser.add_argument( "--raw-dir",
+                         action  = "store",
+                         default = None,
+                         dest    = "raw_dir",
+                         help    = "Directory of CR2 files for the raw " \
+                                   "benchmark." )
+
+    parser.add_argument( "-r",
+                         action  = "store",
+                         default = repeat,
+                         dest    = "repeat",
+                         type    = int,
+                         help    = "How many times to repeat each timing." )
+
+    parser.add_argument( "--tolerance",
+                         action  = "store",
+                         default = tolerance * 100,
+                         dest    = "tolerance",
+                         type    = float,
+                         help    = "Percent slower than --compare that " \
+                                   "counts as a regression (default " \
+                                   "%(default)s)." )
+
+    parser.add_argument( "-v",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "verbose",
+                         help    = "Make this script a chatterbox." )
+
+    args = parser.parse_args()
+
+    raw_dir   = args.raw_dir
+    repeat    = args.repeat
+    tolerance = args.tolerance / 100.
+    verbose   = args.verbose
+
+    # The SDK calls of the capture benchmark would print every OK otherwise
+    c_hlp.verbose = False
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare = json.load(f)["results"]
+
+    return args.benches or sorted(BENCHES), args.output
+
+def Best(func, number=1):
+    """ Time func (called number times per run) repeat times and return the
+        best time per call in seconds. """
+    times = timeit.repeat( func, repeat=repeat, number=number )
+
+    return min(times) / number
+
+def PeakMemory(case):
+    """ Run one of MEMORY_CASES in a fresh process and return how much its
+        run step raised the peak memory of that process, in bytes. A fresh
+        process keeps earlier benchmarks from hiding the peak. """
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process( target=PeakWorker, args=(case, queue) )
+    child.start()
+    peak = queue.get()
+    child.join()
+
+    return peak
+
+def PeakRSS():
+    """ Peak resident memory of this process so far, in bytes. """
+    if sys.platform == "win32":
+        class Counters(ctypes.Structure):
+            _fields_ = [ ("cb", ctypes.c_ulong),
+                         ("PageFaultCount", ctypes.c_ulong),
+                         ("PeakWorkingSetSize", ctypes.c_size_t),
+                         ("WorkingSetSize", ctypes.c_size_t),
+                         ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                         ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                         ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                         ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                         ("PagefileUsage", ctypes.c_size_t),
+                         ("PeakPagefileUsage", ctypes.c_size_t) ]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+                    ctypes.windll.kernel32.GetCurrentProcess(),
+                    ctypes.byref(counters),
+                    counters.cb )
+
+        return counters.PeakWorkingSetSize
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kB everywhere except OS X
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def PeakWorker(case, queue):
+    setup, run = MEMORY_CASES[case]
+    args = setup()
+
+    before = PeakRSS()
+    run(*args)
+    queue.put( PeakRSS() - before )
+
+def Environment():
+    """ What a run was made on, saved along with its results. """
+    return { "date"     : time.strftime("%Y-%m-%d %H:%M:%S"),
+             "machine"  : platform.machine(),
+             "numpy"    : np.__version__,
+             "opencv"   : cv2.__version__,
+             "platform" : platform.platform(),
+             "python"   : platform.python_version(),
+             "repeat"   : repeat }
+
+def Report(name, seconds, baseline=None, memory=None):
+    """ Print a single timing line, with the speedup over baseline and the
+        extra peak memory if given, and the change since the run being
+        compared with. The timing is kept in results. """
+    results[name] = { "seconds" : seconds }
+
+    line = "%-40s %10.3f ms" % ( name, seconds * 1000. )
+    if baseline: line += "   (%.1fx)" % ( baseline / seconds )
+    if memory is not None:
+        line += "   peak +%.1f MB" % ( memory / 2.**20 )
+        results[name]["memory"] = memory
+
+    if compare is not None and name in compare:
+        before = compare[name]["seconds"]
+        line += "   %+.0f%% vs saved" % ( ( seconds / before - 1. ) * 100. )
+
+        if seconds > before * ( 1. + tolerance ):
+            line += " REGRESSION"
+            regressions.append(name)
+
+    print line
+    sys.stdout.flush()
+
+def SaveResults(file_path):
+    """ Write everything reported so far to file_path as JSON. """
+    with open( file_path, "w" ) as f:
+        json.dump( { "environment" : Environment(),
+                     "results"     : results },
+                   f,
+                   indent=1,
+                   sort_keys=True )
+
+def SyntheticBayer(height=raw_height, width=raw_width, bits=12):
+    """ A full size 16-bit frame holding 12-bit sensor values, noise on top of
+        a smooth gradient so it looks a little like a real capture. Built in
+        uint16 throughout so making it doesn't set the peak memory. """
+    top = 2**bits - 1
+    image = np.random.randint( 0, top // 10, (height, width), dtype=np.uint16 )
+    image += ( np.linspace( 0.1, 0.9, width ) * top ).astype(np.uint16)
+
+    return image
+
+def SyntheticLabel(angle=1.3, height=raw_height, width=raw_width):
+    """ A full size 8-bit image with rows of bright bars (stand-ins for lines
+        of text), rotated by angle degrees. """
+    image = np.full( (height, width), 40, np.uint8 )
+    for y in range( height // 7, height * 6 // 7, 120 ):
+        cv2.rectangle( image,
+                       (width // 7, y),
+                       (width * 6 // 7, y + 40),
+                       220,
+                       -1 )
+
+    rotation = cv2.getRotationMatrix2D( (width / 2., height / 2.), angle, 1. )
+
+    return cv2.warpAffine( image, rotation, (width, height) )
+
+def SyntheticEVF(height=evf_height, width=evf_width, quality=75):
+    """ Build a jpeg about the size of a live view frame. Noise keeps the
+        encoder from compressing it down to nothing. """
+    image = np.random.randint( 0, 256, (height, width, 3) ).astype(np.uint8)
+    image = cv2.GaussianBlur( image, (9,9), 0 )
+
+    _, jpeg = cv2.imencode( ".jpg",
+                            image,
+                            [ int(cv2.IMWRITE_JPEG_QUALITY), quality ] )
+
+    return jpeg.tostring()
+
+def Bench_StreamExtraction():
+    """ Compare the old byte-at-a-time end of image scan with the zero-copy
+        view over the stream memory, both feeding cv2.imdecode. """
+    jpeg = SyntheticEVF()
+
+    # Fake the EDSDK memory stream: the jpeg sits at the start of a bigger
+    # buffer followed by zeros (that is what the scanner relies on)
+    stream = ( ctypes.c_ubyte * ( len(jpeg) * 2 ) )()
+    ctypes.memmove( stream, jpeg, len(jpeg) )
+    pointer = ctypes.addressof(stream)
+    values  = ctypes.cast( pointer, ctypes.POINTER(ctypes.c_ubyte) )
+
+    if verbose: print "EVF jpeg is %i bytes" % len(jpeg)
+
+    scanned = c_hlp.ScanJPEG(values)
+    viewed  = c_hlp.BufferView( pointer, len(jpeg) )
+    if scanned != viewed.tostring():
+        print "Extracted frames differ!"
+        sys.stdout.flush()
+
+    t_scan = Best( lambda: c_hlp.ScanJPEG(values) )
+    t_view = Best( lambda: c_hlp.BufferView( pointer, len(jpeg) ), 1000 )
+
+    Report( "ScanJPEG (extract)", t_scan )
+    Report( "BufferView (extract)", t_view, t_scan )
+
+    t_scan = Best( lambda: cv2.imdecode(
+                        np.frombuffer( c_hlp.ScanJPEG(values), np.uint8 ),
+                        cv2.IMREAD_COLOR ) )
+    t_view = Best( lambda: cv2.imdecode(
+                        c_hlp.BufferView( pointer, len(jpeg) ),
+                        cv2.IMREAD_COLOR ), 10 )
+
+    Report( "ScanJPEG + imdecode", t_scan )
+    Report( "BufferView + imdecode", t_view, t_scan )
+
+def Bench_RAWDecode():
+    """ Compare unprocessed_raw.exe + reading its TIFF back with decoding in
+        process through LibRaw, over every CR2 in raw_dir. """
+    if raw_dir is None:
+        print "Skipped, give a directory of CR2 files with --raw-dir"
+        return
+
+    files = sorted( glob.glob( os.path.join( raw_dir, "*.CR2" ) ) )
+    if not files:
+        print "No CR2 files in %s" % raw_dir
+        return
+
+    def Subprocess():
+        for file_path in files:
+            prep_image.ConvertRAW_TIFF(file_path)
+            cv2.imread( file_path + ".tiff", -1 )
+
+    def InProcess():
+        for file_path in files:
+            prep_libraw.ReadBayer(file_path)
+
+    def InMemory():
+        for file_path in files:
+            f = open( file_path, "rb" )
+            prep_libraw.ReadBayerBuffer( f.read() )
+            f.close()
+
+    t_sub = Best(Subprocess) / len(files)
+    t_lib = Best(InProcess) / len(files)
+    t_mem = Best(InMemory) / len(files)
+
+    Report( "unprocessed_raw + TIFF (per file)", t_sub )
+    Report( "LibRaw file (per file)", t_lib, t_sub )
+    Report( "LibRaw buffer (per file)", t_mem, t_sub )
+
+def Bench_Metrics():
+    """ What metrics.Instrument adds to every call of a stage. Without it
+        nothing is wrapped, so there is nothing to time. """
+    class Stage():
+        def Run(self):
+            pass
+
+    stage = Stage()
+    t_plain = Best( stage.Run, 100000 )
+
+    metrics.Instrument( Stage, "Run", "benchmark" )
+    t_timed = Best( stage.Run, 100000 )
+    metrics.Restore()
+
+    Report( "Plain call", t_plain )
+    Report( "Instrumented call", t_timed )
+
+    if verbose:
+        print "%.2f us per instrumented call" % ( ( t_timed - t_plain ) * 1e6 )
+
+def Normalize_Old(image, new_max=255):
+    """ prep_image.Normalize as it used to be, kept as the reference. """
+    min_i = np.min(image)
+    max_i = np.max(image)
+
+    image = (image-min_i) / float( max_i ) * new_max
+
+    return image.astype(np.uint8)
+
+def Bench_Normalize():
+    """ Time and peak memory of normalizing a full size 16-bit frame to
+        uint8, the old float64 way against the single pass version. """
+    image = SyntheticBayer()
+    out = np.empty( image.shape, np.uint8 )
+
+    t_old  = Best( lambda: Normalize_Old(image) )
+    t_new  = Best( lambda: prep_image.Normalize(image) )
+    t_out  = Best( lambda: prep_image.Normalize( image, out=out ) )
+    t_clip = Best( lambda: prep_image.Normalize( image,
+                                                 clip=(0.5, 99.5),
+                                                 out=out ) )
+
+    Report( "Normalize (old, float64)", t_old,
+            memory=PeakMemory("normalize_old") )
+    Report( "Normalize (single pass)", t_new, t_old,
+            memory=PeakMemory("normalize") )
+    Report( "Normalize (single pass, out)", t_out, t_old,
+            memory=PeakMemory("normalize_out") )
+    Report( "Normalize (0.5-99.5% clip, out)", t_clip, t_old,
+            memory=PeakMemory("normalize_clip") )
+
+def PrepImage_Old(image):
+    """ The skew estimate prep_image.PrepImage used to do (full resolution
+        Canny/Hough, a python loop over the lines and drawing every one of
+        them), kept as the reference. """
+    i0 = cv2.Canny( image.copy(), 255, 255 )
+
+    lines = cv2.HoughLinesP( i0,
+                             rho = 1,
+                             theta = np.pi/180.,
+                             threshold = 80,
+                             minLineLength = 50,
+                             maxLineGap = 5 ).reshape(-1, 4)
+
+    num_lines = len(lines)
+
+    slopes = np.zeros(num_lines)
+    for i in range(num_lines):
+
+        dy = lines[i][3] - lines[i][1]
+        dx = lines[i][2] - lines[i][0]
+
+        if dx != 0: slopes[i] = np.arctan( dy / float(dx) ) / np.pi * 180.
+        else: slopes[i] = 0
+
+    i1 = image.copy()
+    for i,line in enumerate(lines):
+        t0 = np.abs(slopes[i])
+
+        if t0 > 5 or t0 < 0.05:
+            cv2.line( i1, (line[0],line[1]), (line[2],line[3]), (0,255,0), 3 )
+
+            cv2.putText( i1,
+                         "%.4f" % slopes[i],
+                         (line[0],line[1]),
+                         cv2.FONT_HERSHEY_PLAIN,
+                         3,
+                         (0,0,255),
+                         2 )
+
+    return i1
+
+def Bench_Deskew():
+    """ Skew estimation on a full size label, the old full resolution
+        PrepImage against EstimateSkew on the pyramid. """
+    image = SyntheticLabel(1.3)
+
+    t_old = Best( lambda: PrepImage_Old(image) )
+    t_new = Best( lambda: prep_image.EstimateSkew(image) )
+    t_rot = Best( lambda: prep_image.PrepImage(image) )
+
+    angle, confidence = prep_image.EstimateSkew(image)
+    if verbose:
+        print "Estimated %.3f (confidence %.2f) for a 1.3 degree rotation" % \
+                                                    ( -angle, confidence )
+
+    Report( "PrepImage (old, full resolution)", t_old )
+    Report( "EstimateSkew", t_new, t_old )
+    Report( "PrepImage (estimate + rotate)", t_rot, t_old )
+
+def Bench_Unwrap():
+    """ Deskew + polar unwrap of a full size label with the remap tables
+        built every time (cold) against reusing the cached ones (warm). The
+        angle is given so skew estimation isn't part of the timing. """
+    image = SyntheticLabel(1.3)
+
+    def Cold():
+        prep_geometry.cache.Clear()
+        prep_geometry.Unwrap( image, angle=-1.3 )
+
+    t_cold = Best(Cold)
+    t_warm = Best( lambda: prep_geometry.Unwrap( image, angle=-1.3 ) )
+
+    Report( "Unwrap (cold cache)", t_cold )
+    Report( "Unwrap (warm cache)", t_warm, t_cold )
+
+def Bench_Headers():
+    """ Compare parsing the EDSDK headers, as every import used to, with
+        loading the cached tables, and time importing the table modules in a
+        fresh interpreter now that nothing is loaded until it is used. """
+    tables = ( canon_types.eds_typ, canon_errors.eds_err )
+    if not all( os.path.exists(table.header) for table in tables ):
+        print "Skipped, the EDSDK headers aren't in %s" % c_hdr.header_dir
+        return
+
+    for table in tables:
+        table.Generate()
+        name = os.path.basename(table.header)
+
+        t_parse = Best( lambda: table.parse(table.header) )
+        t_load  = Best( lambda: c_hdr.LazyTable( table.header,
+                                                 table.parse ).Load() )
+
+        Report( "%s parse" % name, t_parse )
+        Report( "%s cached" % name, t_load, t_parse )
+
+    def Python(code):
+        return Best( lambda: sp.check_call( [ sys.executable, "-c", code ] ) )
+
+    t_bare   = Python("pass")
+    t_import = Python("import canon_types, canon_errors") - t_bare
+    t_first  = Python("import canon_types, canon_errors; "
+                      "canon_types.eds_typ['kEdsPropID_ISOSpeed']; "
+                      "canon_errors.eds_err[0]") - t_bare
+
+    Report( "import canon_types, canon_errors", t_import )
+    Report( "import + first lookups", t_first )
+
+def SimulatedCamera(folders=4, files=250, latency=0.):
+    """ A CanonLiveView on canon_sim's SimulatedSDK, its card holding
+        folders folders of files full size RAW captures (all the same
+        string, so they cost no memory) and every SDK call taking latency
+        seconds. Returns (sdk, camera). """
+    sdk = canon_sim.SimulatedSDK( frames   = [ SyntheticEVF() ],
+                                  latency  = dict( ( name, latency ) for name
+                                                   in c_sdk.prototypes ),
+                                  capture_size = raw_height * raw_width )
+
+    # Live view already on the PC, which skips the wait for the mirror
+    sdk.properties[ canon_types.eds_typ["kEdsPropID_Evf_OutputDevice"] ] = \
+                    canon_types.eds_typ["kEdsEvfOutputDevice_PC"]
+
+    for folder in range(folders):
+        for i in range(files):
+            sdk.AddFile( "IMG_%04d.CR2" % ( folder * files + i ),
+                         sdk.capture,
+                         "%iCANON" % ( 100 + folder ) )
+
+    previous = c_sdk.UseBackend(sdk)
+    try:
+        camera = canon_cam.CanonLiveView( save_to   = "card",
+                                          in_memory = True,
+                                          archive   = False )
+    finally:
+        c_sdk.UseBackend(previous)
+
+    return sdk, camera
+
+def Bench_Capture():
+    """ The camera side of canon_cam against a simulated camera: grabbing a
+        live view frame and finding and downloading the last RAW file on the
+        card, once with free SDK calls (our own overhead) and once with
+        every call taking a millisecond like a USB round trip. """
+    for latency in ( 0., 0.001 ):
+        sdk, camera = SimulatedCamera( latency=latency )
+        name = "%.0f ms/call" % ( latency * 1000. )
+
+        def Walk():
+            camera.FindLastImage().Release()
+
+        def Download():
+            path, data = camera.DownloadImage()
+
+            # Put it back so the card never runs out
+            sdk.AddFile( os.path.basename(path),
+                         sdk.capture,
+                         sdk.card.Child("DCIM").children[-1].name )
+
+        calls = sum( sdk.calls.values() )
+        Download()
+        if verbose:
+            print "%s: %i SDK calls per download" % ( name,
+                                                     sum( sdk.calls.values() )
+                                                     - calls )
+
+        Report( "GrabImage (%s)" % name, Best( camera.GrabImage, 10 ) )
+        Report( "GrabFrame (%s)" % name, Best( camera.GrabFrame, 10 ) )
+        Report( "FindLastImage walk (%s)" % name, Best(Walk) )
+        Report( "DownloadImage, memory (%s)" % name, Best(Download) )
+
+        camera.Cleanup()
+
+        if sdk.Outstanding():
+            print "Refs never released: %s" % sdk.Outstanding()
+
+def Overlay_Old(image, labels, live=False):
+    """ The live view overlay as LivePreviewImage used to draw it, on a
+        copy of the frame at its own size (before the 4x resize), kept as
+        the reference. """
+    image = image.copy()
+    height, width, _ = image.shape
+    iso, iso_to, av, av_to, tv, tv_to = labels
+
+    # User Controls
+    cv2.rectangle(image, (0,0), (280,100), (0,0,0), -1)
+
+    canon_overlay.DrawSetting( image, "(a,q) ISO = %s" % iso, iso_to, 20 )
+    canon_overlay.DrawSetting( image, "(s,w) Aperture = %s" % av, av_to, 40 )
+    canon_overlay.DrawSetting( image, "(d,e) Shutter = %s" % tv, tv_to, 60 )
+
+    if live:
+        cv2.circle( image, ( width-20, 20 ), 10, (0,255,0), -1 )
+
+    # Grid
+    for line_x in canon_overlay.GridLines(width):
+        cv2.line( image, ( line_x, 0 ), ( line_x, height ), ( 0, 255, 0 ) )
+
+    for line_y in canon_overlay.GridLines(height):
+        cv2.line( image, ( 0, line_y ), ( width, line_y ), ( 0, 255, 0 ) )
+
+    cv2.circle( image,
+                ( width // 2, height // 2 ),
+                canon_overlay.LabelRadius(height),
+                ( 0, 0, 255 ),
+                1 )
+
+    return image
+
+def Bench_LiveView():
+    """ The per frame work of the live view display on a typical EVF jpeg:
+        decoding it, the overlay drawn the old way at frame size and the 4x
+        resize for the window, the same done by OverlayCompositor at
+        display size into the last display frame (what the live view does
+        now), the reduced grayscale
+        decodes the analysis uses instead and the fingerprint that saves
+        all of it on repeated frames. """
+    jpeg = np.frombuffer( SyntheticEVF(), np.uint8 )
+
+    def Frame():
+        frame = canon_cam.LivePreviewImage()
+        frame.jpeg = jpeg
+        frame.iso, frame.av, frame.tv = "100", "5.6", "1/60"
+
+        return frame
+
+    frame = Frame()
+    image = frame.Color()
+    labels = frame.Labels()
+
+    def Whole():
+        frame = Frame()
+        cv2.resize( Overlay_Old( frame.Color(), frame.Labels() ),
+                    None, fx=4, fy=4,
+                    interpolation=cv2.INTER_NEAREST )
+
+    compositor = canon_overlay.OverlayCompositor()
+    display = [ compositor.Compose( image, labels ) ] # Layers made once
+
+    def Composite():
+        frame = Frame()
+        display[0] = compositor.Compose( frame.Color(), frame.Labels(),
+                                         out=display[0] )
+
+    t_decode = Best( lambda: cv2.imdecode( jpeg, cv2.IMREAD_COLOR ), 10 )
+    t_whole  = Best( Whole, 10 )
+    t_comp   = Best( Composite, 10 )
+
+    Report( "imdecode (EVF jpeg)", t_decode )
+    Report( "Fingerprint (repeat check)",
+            Best( lambda: canon_liveview.Fingerprint(jpeg), 1000 ),
+            t_decode )
+    for scale in ( 2, 4 ):
+        Report( "Gray(%i) reduced decode" % scale,
+                Best( lambda: Frame().Gray(scale), 10 ),
+                t_decode )
+    Report( "Overlay (old, frame size)",
+            Best( lambda: Overlay_Old( image, labels ), 10 ) )
+    Report( "4x display resize", Best( lambda: cv2.resize(
+                                           image,
+                                           None, fx=4, fy=4,
+                                           interpolation=cv2.INTER_NEAREST ),
+                                       10 ) )
+    Report( "Whole frame", t_whole )
+    Report( "Compose (cached layers)", Best( lambda: compositor.Compose(
+                                                 image, labels,
+                                                 out=display[0] ),
+                                             10 ) )
+    Report( "Whole frame, composited", t_comp, t_whole )
+
+    if verbose:
+        print "Display bound at %.1f fps (%.1f fps composited)" % (
+              1. / t_whole, 1. / t_comp )
+
+BENCHES = { "capture"   : Bench_Capture,
+            "deskew"    : Bench_Deskew,
+            "headers"   : Bench_Headers,
+            "liveview"  : Bench_LiveView,
+            "metrics"   : Bench_Metrics,
+            "normalize" : Bench_Normalize,
+            "raw"       : Bench_RAWDecode,
+            "stream"    : Bench_StreamExtraction,
+            "unwrap"    : Bench_Unwrap }
+
+# (setup, run) pairs for PeakMemory; module level so a child process can find
+# them by name. Outputs are made with ones, not empty, so their pages are
+# already resident before the run starts
+MEMORY_CASES = {
+    "normalize_old"  : ( lambda: ( SyntheticBayer(), ),
+                         lambda image: Normalize_Old(image) ),
+    "normalize"      : ( lambda: ( SyntheticBayer(), ),
+                         lambda image: prep_image.Normalize(image) ),
+    "normalize_out"  : ( lambda: ( SyntheticBayer(),
+                                   np.ones( (raw_height, raw_width),
+                                            np.uint8 ) ),
+                         lambda image, out: prep_image.Normalize( image,
+                                                                  out=out ) ),
+    "normalize_clip" : ( lambda: ( SyntheticBayer(),
+                                   np.ones( (raw_height, raw_width),
+                                            np.uint8 ) ),
+                         lambda image, out: prep_image.Normalize(
+                                                image,
+                                                clip=(0.5, 99.5),
+                                                out=out ) ) }
+
+if __name__ == "__main__":
+    benches, output = ArgParser()
+
+    for name in benches:
+        print "\n[%s]" % name
+        BENCHES[name]()
+
+    if output is not None:
+        SaveResults(output)
+
+    if regressions:
+        print "\n%i slower than saved: %s" % ( len(regressions),
+                                              ", ".join(regressions) )
+        sys.exit(1)
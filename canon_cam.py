@@ -1,12 +1,7 @@
 #!/cygdrive/c/Python27_32/python
 """
-    TODO: - Add event callbacks to monitor camera status (could improve
-            refresh rate and script speed)
-          - Add HOUGH lines from OpenCV to give feedback on possible rotation
+    TODO: - Add HOUGH lines from OpenCV to give feedback on possible rotation
             needed to square image
-          - Take picture and immediately transfer to the computer (current
-            behavior saves image on the camera memory card and transferring
-            is left up to the user by some other method outside this script)
 """
 ###############################################################################
 ###                                                                         ###
@@ -14,15 +9,28 @@
 ###                                                                         ###
 ###############################################################################
 import argparse
+import atexit
 import cv2
 import ctypes
 import numpy as np
 import os
+import Queue
 import sys
+import threading
 import time
 
 # Try to reduce the clutter in this script
 import canon_helpers as c_hlp # Our helpers
+from canon_focus import FocusAnalyzer # Auto capture, see --auto
+import canon_sdk as c_sdk # The EDSDK binding
+import canon_sim # Simulated camera, see --sim
+import metrics # Stage latencies, see --metrics
+from canon_events import CameraEvents # EDSDK event callbacks
+import prep_image # RAW decode and processing of the captures
+from canon_liveview import LiveViewEngine # Threaded grab/decode
+from canon_overlay import OverlayCompositor # Overlay at display size
+from canon_refs import EdsRef # Owned EDSDK references
+from canon_state import CameraState, SettingsWriter # Camera properties
 from canon_errors import * # EDSDK Errors from the errors header
 from canon_types import * # EDSDK Types from the types header
 
@@ -36,11 +44,9 @@ depth  = 3    # Color image so 3 channels
 height = 2848 # Height and Width are the image format set in the camera;
 IM_DIR = "C:\\Code\\Records\\images\\"
 live   = False # use as an indicator for the live stream window to indicate live
+reduced_decode = None # Whether imdecode scales, see ReducedDecode
 width  = 4272 # These values are the maximum for the Canon Rebel Xsi
 
-# Load the canon library
-edsdk_dll = ctypes.WinDLL("EDSDK\\EDSDK.dll")
-
 # Debug Timer stuff
 tracker=False; e1=0;
 
@@ -67,128 +73,159 @@ class LivePreviewImage(ctypes.Structure):
         # we will use this to detect the end of the buffer
         end = "ffd900"
 
+        # imread flags of the grayscale decodes by scale; the reduced ones
+        # scale in the jpeg decoder (DCT scaling), which is much cheaper than
+        # decoding everything and resizing
+        grayscale = { 1 : cv2.IMREAD_GRAYSCALE,
+                      2 : cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4 : cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                      8 : cv2.IMREAD_REDUCED_GRAYSCALE_8 }
+
         def __init__(self):
-            self.height = 0 # the height of self.image
-            self.image  = None # this will contain a numpy array
+            self.color  = None # The plain color decode, see Color
+            self.grays  = {} # The grayscale decodes by scale, see Gray
             self.jpeg   = None # Will be byte string containing the image
             self.length = 0 # Will be the length of the data buffer
-            self.label_r= 0 # the radius of the label in the image
-            self.width  = 0 # the width of self.image
-            self.x_c_p  = 0 # the center of the image
-            self.y_c_p  = 0 # the center of the image
-
-            self.h_lines = []
-            self.v_lines = []
-
-            self.av  = 0
-            self.iso = 0
-            self.tv  = 0
-
-        def Overlay(self):
-            # Draw all over the image so we can square the physical object
-
-            # Grid
-            for line_x in self.v_lines:
-                cv2.line( self.image,
-                          ( line_x, 0 ),
-                          ( line_x, self.height ),
-                          ( 0, 255, 0 ) )
-
-            for line_y in self.h_lines:
-                cv2.line( self.image,
-                          ( 0, line_y ),
-                          ( self.width, line_y ),
-                          ( 0, 255, 0 ) )
-
-            cv2.circle( self.image,
-                        ( self.x_c_p, self.y_c_p ),
-                        self.label_r,
-                        ( 0, 0, 255 ),
-                        1 )
-
-        def PopulateImage(self):
-            self.image = cv2.imdecode( np.fromstring( self.jpeg, np.uint8 ),
-                                       cv2.IMREAD_COLOR )
-
-            self.height,self.width,_ = self.image.shape
-            self.x_c_p = self.width // 2
-            self.y_c_p = self.height // 2
-
-            self.label_r = int( self.y_c_p * 0.95 )
-
-            # Generate lists of gridlines
-            grid_spacing = 100
-            # Vertical grid lines
-            t0 = self.width // grid_spacing
-            t1 = t0 // 2; t0 = ( t0 + 1 ) // 2
-            self.v_lines = [(i*grid_spacing+self.x_c_p) for i in range(-t1,t0)]
-            # Horizontal grid lines
-            t0 = self.height // grid_spacing
-            t1 = t0 // 2; t0 = ( t0 + 1 ) // 2
-            self.h_lines = [(i*grid_spacing+self.y_c_p) for i in range(-t1,t0)]
-
-            # User Controls
-            cv2.rectangle(self.image, (0,0), (200,100), (0,0,0), -1)
-
-            cv2.putText( self.image,
-                         "(a,q) ISO = %s" % iso[self.iso],
-                         ( 5, 20 ),
-                         cv2.FONT_HERSHEY_PLAIN,
-                         1,
-                         (255,255,255) )
-
-            cv2.putText( self.image,
-                         "(s,w) Aperture = %s" % av[self.av],
-                         ( 5, 40 ),
-                         cv2.FONT_HERSHEY_PLAIN,
-                         1,
-                         (255,255,255) )
-
-            cv2.putText( self.image,
-                         "(d,e) Shutter = %s" % tv[self.tv],
-                         ( 5, 60 ),
-                         cv2.FONT_HERSHEY_PLAIN,
-                         1,
-                         (255,255,255) )
-
-            if live:
-                cv2.circle( self.image,
-                            ( self.width-20, 20 ),
-                            10,
-                            (0,255,0),
-                            -1 )
+            self.motion = 0. # Scores of the label, see FocusAnalyzer
+            self.sharpness = 0.
+
+            self.av  = "" # Labels of the settings for the overlay
+            self.iso = ""
+            self.tv  = ""
+
+            self.av_to  = None # Labels of the values they are being changed
+            self.iso_to = None # to, while the camera hasn't confirmed them
+            self.tv_to  = None
+
+        def Bytes(self):
+            """ The jpeg as a string, for passing it on as is. """
+            if not isinstance( self.jpeg, str ):
+                self.jpeg = np.asarray( self.jpeg, np.uint8 ).tostring()
+
+            return self.jpeg
+
+        def Color(self):
+            """ The frame decoded in full color, without the overlay. Decoded
+                the first time it is asked for; don't draw on it. """
+            if self.color is None:
+                self.color = cv2.imdecode( np.frombuffer( self.jpeg,
+                                                          np.uint8 ),
+                                           cv2.IMREAD_COLOR )
+                if self.color is None:
+                    raise ValueError( "Corrupt live view frame" )
+
+            return self.color
+
+        def Gray(self, scale=4):
+            """ The frame decoded in grayscale at 1/scale (1, 2, 4 or 8) of
+                its size, which is plenty for focus, centering or exposure.
+                Each scale is decoded the first time it is asked for. """
+            if scale not in self.grays:
+                if scale > 1 and not ReducedDecode() and \
+                   self.color is not None:
+                    # No cheap decode, but the color one is already done
+                    gray = cv2.cvtColor( self.color, cv2.COLOR_BGR2GRAY )
+                else:
+                    gray = cv2.imdecode( np.frombuffer( self.jpeg,
+                                                        np.uint8 ),
+                                         self.grayscale[scale] )
+
+                if scale > 1 and not ReducedDecode():
+                    gray = cv2.resize( gray,
+                                       None, fx=1./scale, fy=1./scale,
+                                       interpolation=cv2.INTER_AREA )
+
+                self.grays[scale] = gray
+
+            return self.grays[scale]
+
+        def Labels(self):
+            """ The settings shown in the overlay, as OverlayCompositor
+                takes them. """
+            return ( self.iso, self.iso_to,
+                     self.av,  self.av_to,
+                     self.tv,  self.tv_to )
+
+
+class ArchiveWriter():
+    """ Write files on a background thread so saving a copy of a capture
+        doesn't hold up processing it. A write that fails is reported and
+        counted in failed; the thread keeps going with the next one. """
+
+    def __init__(self):
+        self.failed = 0 # Files that couldn't be written
+        self.queue  = Queue.Queue()
+        self.thread = threading.Thread( target=self.Run, name="archiver" )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Close(self):
+        """ Wait for everything queued so far to be written. """
+        self.queue.put(None)
+        self.thread.join()
+
+    def Run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: break
+
+            file_path, data = item
+            try:
+                with open( file_path, "wb" ) as f:
+                    f.write(data)
+
+            except ( IOError, OSError ) as e:
+                print "Archiving %s failed (%s); it is processed but not " \
+                      "kept" % ( file_path, e )
+                self.failed += 1
+
+    def Write(self, file_path, data):
+        self.queue.put( ( file_path, data ) )
 
 
 class CanonLiveView():
 
-    def __init__(self):
+    def __init__(self, save_to="host", in_memory=False, archive=True):
 
-        self.buffer_size = ctypes.c_ulonglong( depth * width * height )
-        self.camera      = ctypes.c_void_p(None)
+        self.dll         = c_sdk.LoadEDSDK() # The EDSDK or a stand-in
+        self.buffer_size = c_sdk.EdsUInt64( depth * width * height )
+        self.camera      = EdsRef(self.dll, "camera")
+        self.compositor  = OverlayCompositor() # Draws the overlay
         self.data        = LivePreviewImage()
         self.device      = ctypes.c_uint(0)
-        self.image_ref   = ctypes.c_void_p(None)
+        self.events      = None
+        self.focus       = None # FocusAnalyzer, set it to auto capture
+        self.image_ref   = EdsRef(self.dll, "evf image")
         self.out_buffer  = ctypes.c_void_p(None)
-        self.stream      = ctypes.c_void_p(None)
-
-        self.prop_iso    = ctypes.c_uint()
-        self.prop_av     = ctypes.c_uint()
-        self.prop_tv     = ctypes.c_uint()
+        self.out_length  = c_sdk.EdsUInt64(0)
+        self.save_to     = save_to # "host" (straight to IM_DIR) or "card"
+        self.sdk_lock    = threading.RLock() # Hold around camera calls
+        self.state       = None # CameraState, the cached settings
+        self.in_memory   = in_memory # download captures into memory
+        self.archive     = archive # also keep a copy of them in IM_DIR
+        self.archiver    = ArchiveWriter() if in_memory and archive else None
+        self.stream      = EdsRef(self.dll, "evf stream")
+        self.writer      = None # SettingsWriter, changes them off this thread
 
         self.Initialize()
 
     def Cleanup(self):
-        if self.stream.value != None:
-            status = edsdk_dll.EdsRelease(self.stream)
-            self.Error("Release stream", status)
+        status = self.stream.Release()
+        self.Error("Release stream", status)
+
+        status = self.image_ref.Release()
+        self.Error("Release image_ref", status)
+
+        # Let the last setting changes through before the events stop
+        self.writer.Close()
+        self.events.Close()
 
-        if self.image_ref.value != None:
-            status = edsdk_dll.EdsRelease(self.image_ref)
-            self.Error("Release image_ref", status)
+        if self.archiver is not None:
+            self.archiver.Close()
 
         # Close the live stream, then all of the streams, and last the edsdk
         self.device = ctypes.c_uint(0)
-        status = edsdk_dll.EdsSetPropertyData(
+        status = self.dll.EdsSetPropertyData(
                     self.camera,
                     eds_typ["kEdsPropID_Evf_OutputDevice"],
                     0,
@@ -196,208 +233,278 @@ class CanonLiveView():
                     ctypes.byref(self.device) )
         self.Error("Disconnect Output Device", status)
 
-        status = edsdk_dll.EdsCloseSession(self.camera)
+        status = self.dll.EdsCloseSession(self.camera)
         self.Error("EdsCloseSession", status)
 
-        status = edsdk_dll.EdsRelease(self.camera)
+        status = self.camera.Release()
         self.Error("EdsRelease camera", status)
 
-        status = edsdk_dll.EdsTerminateSDK()
+        status = self.dll.EdsTerminateSDK()
         self.Error("EdsTerminateSDK", status)
 
-    def DownloadImage(self):
-        count    = ctypes.c_ulonglong(0)
-        DCIM     = False
-        dir_item = ctypes.c_void_p()
-        volume   = ctypes.c_void_p()
+    def DownloadImage(self, file_item=None):
+        """ Download file_item (a directory item ref, e.g. the one Take_Picture
+            returns) and delete it from the card if it was written there.
+            Without a ref the last image on the card is looked up first.
+
+            Normally the file is written to IM_DIR. With in_memory set it is
+            downloaded into a memory stream instead so it can go straight to
+            the processing, and writing it to IM_DIR (if archive is set) is
+            left to a background thread. Returns (path, data) where data is
+            the file contents or None if it only went to disk, or None if
+            there was nothing to download. file_item is released when done.
+        """
+        if file_item is None:
+            # When saving to the host there is nothing on the card to find
+            if self.save_to == "host": return None
+
+            file_item = self.FindLastImage()
+            if file_item is None: return None
+
+        file_item_info = EdsDirectoryItemInfo()
+        status = self.dll.EdsGetDirectoryItemInfo(
+                    file_item,
+                    ctypes.byref(file_item_info) )
+        self.Error("Get Item Info", status)
+
+        file_path = IM_DIR + file_item_info.szFileName
+        file_size = c_sdk.EdsUInt64(file_item_info.size)
+
+        file_stream = EdsRef(self.dll, "file stream")
+        if self.in_memory:
+            status = self.dll.EdsCreateMemoryStream( file_size,
+                                                     file_stream.Out() )
+            self.Error("Create Memory Stream", status)
+
+        else:
+            status = self.dll.EdsCreateFileStream(
+                        file_path,
+                        1,#eds_typ["kEdsFileCreateDisposition_CreateAlways"],
+                        2,#eds_typ["kEdsAccess_ReadWrite"],
+                        file_stream.Out() )
+            self.Error("Create File Stream", status)
 
-        status = edsdk_dll.EdsGetChildCount( self.camera, ctypes.byref(count) )
-        self.Error("Get Camera count", status)
+        status = self.dll.EdsDownload( file_item, file_size, file_stream )
+        self.Error("Download image", status)
 
-        status = edsdk_dll.EdsGetChildAtIndex( self.camera,
-                                               0,
-                                               ctypes.byref(volume) )
-        self.Error("Get Volume", status)
+        status = self.dll.EdsDownloadComplete( file_item )
+        self.Error("Download Complete", status)
 
-        status = edsdk_dll.EdsGetChildCount( volume, ctypes.byref(count) )
-        self.Error("Get Volume count", status)
+        data = None
+        if self.in_memory:
+            pointer = ctypes.c_void_p(None)
+            status = self.dll.EdsGetPointer( file_stream,
+                                             ctypes.byref(pointer) )
+            self.Error("Get Pointer to Download", status)
 
-        for i in range(count.value):
+            # One copy out of the stream, which gets released below
+            data = ctypes.string_at( pointer, file_size.value )
 
-            dir_item_info = EdsDirectoryItemInfo()
+            if self.archive: self.archiver.Write( file_path, data )
 
-            status = edsdk_dll.EdsGetChildAtIndex( volume,
-                                                   i,
-                                                   ctypes.byref(dir_item) )
-            self.Error("Get Child at Index %i"%i, status)
+            downloaded = len(data) == file_size.value
+        else:
+            # Verify file is downloaded locally
+            downloaded = os.path.isfile( file_path )
+
+        if self.save_to == "card" and downloaded:
+            # delete the file on the camera
+            status = self.dll.EdsDeleteDirectoryItem( file_item )
+            self.Error("Delete remote file",status)
+
+        status = file_item.Release()
+        self.Error("Release file item",status)
 
-            status = edsdk_dll.EdsGetDirectoryItemInfo(
-                        dir_item,
-                        ctypes.byref(dir_item_info) )
-            self.Error("Get Item Info", status)
+        status = file_stream.Release()
+        self.Error("Release file stream",status)
 
-            if dir_item_info.isFolder == 1 and \
-               dir_item_info.szFileName == "DCIM":
-                DCIM = True
-                break
+        return ( file_path, data )
 
-        if not DCIM:
+    def Error(self, msg, error, *args):
+        """ Check the status of an EDSDK call; msg % args is only formatted
+            when it gets printed. """
+        if error != 0 or c_hlp.verbose:
+            c_sdk.Check( error, msg, *args )
+
+    def FindLastImage(self):
+        """ Walk the card (volume -> DCIM -> last folder) and return a ref to
+            the last file on it, or None if there isn't one. Every folder
+            ref on the way is released again. """
+        count    = c_sdk.EdsUInt32(0)
+        dir_item = self.GetDCIMFolder()
+        if dir_item is None:
             self.Error( "DCIM folder not found on camera.",0x40 )
-            return -1
+            return None
 
         # The idea is to download the last image taken
         while True:
-            status = edsdk_dll.EdsGetChildCount( dir_item, ctypes.byref(count) )
-            self.Error( "Get %s count (%i)" % ( dir_item_info.szFileName,
-                                                count.value ),
-                        status)
-
-            if count.value == 0:
-                self.Error( "No image found on camera.", 0x22 )
-                return -1
-
-            child_item = ctypes.c_void_p()
-            child_item_info = EdsDirectoryItemInfo()
-
-            status = edsdk_dll.EdsGetChildAtIndex( dir_item,
-                                                   (count.value - 1),
-                                                   ctypes.byref(child_item) )
-            self.Error("Get File at Index %i"%i, status)
-
-            status = edsdk_dll.EdsGetDirectoryItemInfo(
-                        child_item,
-                        ctypes.byref(child_item_info) )
-            self.Error("Get Item Info (%s)"%child_item_info.szFileName, status)
-
+            with dir_item:
+                status = self.dll.EdsGetChildCount( dir_item,
+                                                    ctypes.byref(count) )
+                self.Error( "Get folder count (%i)", status, count.value )
+
+                if count.value == 0:
+                    self.Error( "No image found on camera.", 0x22 )
+                    return None
+
+                child_item = EdsRef(self.dll, "directory item")
+                child_item_info = EdsDirectoryItemInfo()
+
+                status = self.dll.EdsGetChildAtIndex( dir_item,
+                                                      (count.value - 1),
+                                                      child_item.Out() )
+                self.Error( "Get File at Index %i", status, count.value - 1 )
+
+                status = self.dll.EdsGetDirectoryItemInfo(
+                            child_item,
+                            ctypes.byref(child_item_info) )
+                self.Error( "Get Item Info (%s)",
+                            status,
+                            child_item_info.szFileName )
+
+            # The parent folder is released by now
             if child_item_info.isFolder == 0:
-                file_item = child_item
-                file_item_info = child_item_info
-                break
+                return child_item
 
-            else:
-                dir_item = child_item
+            dir_item = child_item
 
-        file_stream = ctypes.c_void_p(None)
-        status = edsdk_dll.EdsCreateFileStream(
-                        IM_DIR + file_item_info.szFileName,
-                        1,#eds_typ["kEdsFileCreateDisposition_CreateAlways"],
-                        2,#eds_typ["kEdsAccess_ReadWrite"],
-                        ctypes.byref(file_stream) )
-        self.Error("Create File Stream", status)
+    def GetDCIMFolder(self):
+        """ Return a ref to the DCIM folder on the first volume of the card
+            (the caller releases it), or None if there isn't one. """
+        count = c_sdk.EdsUInt32(0)
 
-        status = edsdk_dll.EdsDownload( file_item,
-                                        ctypes.c_ulonglong(file_item_info.size),
-                                        file_stream )
-        self.Error("Download image", status)
+        status = self.dll.EdsGetChildCount( self.camera, ctypes.byref(count) )
+        self.Error("Get Camera count", status)
 
-        status = edsdk_dll.EdsDownloadComplete( file_item )
-        self.Error("Download Complete", status)
+        with EdsRef(self.dll, "volume") as volume:
+            status = self.dll.EdsGetChildAtIndex( self.camera,
+                                                  0,
+                                                  volume.Out() )
+            self.Error("Get Volume", status)
 
-        # Verify file is downloaded locally
-        if os.path.isfile( cwd + file_item_info.szFileName ):
-            # delete the file on the camera
-            status = edsdk_dll.EdsDeleteDirectoryItem( file_item )
-            self.Error("Delete remote file",status)
+            status = self.dll.EdsGetChildCount( volume, ctypes.byref(count) )
+            self.Error("Get Volume count", status)
 
-        status = edsdk_dll.EdsRelease( file_item )
-        self.Error("Release file item",status)
+            for i in range(count.value):
+                dir_item = EdsRef(self.dll, "directory item")
+                dir_item_info = EdsDirectoryItemInfo()
 
-        status = edsdk_dll.EdsRelease( file_stream )
-        self.Error("Release file stream",status)
+                status = self.dll.EdsGetChildAtIndex( volume,
+                                                      i,
+                                                      dir_item.Out() )
+                self.Error( "Get Child at Index %i", status, i )
 
-    def Error(self, msg, error):
-        if error != 0 or c_hlp.verbose:
-            c_hlp.ProcessError( msg, error, eds_err )
+                status = self.dll.EdsGetDirectoryItemInfo(
+                            dir_item,
+                            ctypes.byref(dir_item_info) )
+                self.Error("Get Item Info", status)
 
-    def GetDCIMFolder(self):
-        count    = ctypes.c_ulonglong(0)
-        DCIM     = None
-        dir_item = ctypes.c_void_p()
-        volume   = ctypes.c_void_p()
+                if dir_item_info.isFolder == 1 and \
+                   dir_item_info.szFileName == "DCIM":
+                    return dir_item
 
-        status = edsdk_dll.EdsGetChildCount( self.camera, ctypes.byref(count) )
-        self.Error("Get Camera count", status)
+                status = dir_item.Release()
+                self.Error("Release of dir_item error", status)
 
-        status = edsdk_dll.EdsGetChildAtIndex( self.camera,
-                                               0,
-                                               ctypes.byref(volume) )
-        self.Error("Get Volume", status)
+        return None
 
-        status = edsdk_dll.EdsGetChildCount( volume, ctypes.byref(count) )
-        self.Error("Get Volume count", status)
+    def DecodeFrame(self, jpeg):
+        """ Turn a jpeg from GrabFrame into a decoded frame ready for the
+            compositor. Every frame gets its own LivePreviewImage so this can
+            run on the decode thread. The settings shown are what the camera
+            last reported. """
+        frame = LivePreviewImage()
+        frame.jpeg   = jpeg
+        frame.length = len(jpeg)
 
-        for i in range(count.value):
+        frame.av,  frame.av_to  = self.SettingLabels( "kEdsPropID_Av", av )
+        frame.iso, frame.iso_to = self.SettingLabels( "kEdsPropID_ISOSpeed",
+                                                      iso )
+        frame.tv,  frame.tv_to  = self.SettingLabels( "kEdsPropID_Tv", tv )
 
-            dir_item_info = EdsDirectoryItemInfo()
+        frame.Color() # Decoded here, off the UI thread
 
-            status = edsdk_dll.EdsGetChildAtIndex( volume,
-                                                   i,
-                                                   ctypes.byref(dir_item) )
-            self.Error("Get Child at Index %i"%i, status)
+        if self.focus is not None:
+            self.focus.Update(frame)
 
-            status = edsdk_dll.EdsGetDirectoryItemInfo(
-                        dir_item,
-                        ctypes.byref(dir_item_info) )
-            self.Error("Get Item Info", status)
+        return frame
 
-            if dir_item_info.szFileName == "DCIM":
-                DCIM = dir_item
-                status = edsdk_dll.EdsRelease(dir_item)
-                self.Error("Release of dir_item error", status)
-                dir_item = None
-                break
+    def GrabFrame(self):
+        """ Grab the next live view frame and return a copy of its jpeg since
+            the stream memory gets overwritten by the next download. Camera
+            events are delivered on the way, which keeps self.state current.
+        """
+        self.events.Pump()
+        self.GrabImage()
 
-        return DCIM
+        return np.frombuffer( self.data.jpeg, np.uint8 ).copy()
 
     def GrabImage(self):
-        if self.stream.value != None:
-            status = edsdk_dll.EdsCreateEvfImageRef(
-                        self.stream,
-                        ctypes.byref( self.image_ref ) )
+        # A new EVF image ref every frame; Out gives back last frame's one
+        if self.stream:
+            status = self.dll.EdsCreateEvfImageRef( self.stream,
+                                                    self.image_ref.Out() )
             if status != 0: self.Error("Create image reference", status)
 
-        if self.image_ref.value != None:
-            status = edsdk_dll.EdsDownloadEvfImage(self.camera, self.image_ref)
+        if self.image_ref:
+            status = self.dll.EdsDownloadEvfImage(self.camera, self.image_ref)
             # self.Error("Download image", status)
 
-        status = edsdk_dll.EdsGetPointer( self.stream,
-                                          ctypes.byref( self.out_buffer ) )
+        status = self.dll.EdsGetPointer( self.stream,
+                                         ctypes.byref( self.out_buffer ) )
         # self.Error("Get Pointer to Output Buffer", status)
 
         self.data.values = ctypes.cast( self.out_buffer,
                                         ctypes.POINTER(ctypes.c_ubyte) )
 
-        self.data.jpeg = self.StreamToString(self.data.values)
+        # Ask the stream how much it holds instead of hunting for the end of
+        # the jpeg one byte at a time
+        status = self.dll.EdsGetLength( self.stream,
+                                        ctypes.byref( self.out_length ) )
+
+        if status == 0 and self.out_length.value > 0:
+            self.data.length = self.out_length.value
+            self.data.jpeg = c_hlp.BufferView( self.out_buffer.value,
+                                               self.data.length )
+        else:
+            self.data.jpeg = c_hlp.ScanJPEG(self.data.values)
+            self.data.length = len(self.data.jpeg)
 
     def Initialize(self):
         # From the SDK:
         #     When using the EDSDK libraries, you must call this API once
         #     before using EDSDK APIs
         # Sounds like good advice, let's take it
-        status = edsdk_dll.EdsInitializeSDK()
+        status = self.dll.EdsInitializeSDK()
         self.Error("EdsInitializeSDK", status)
 
         # Get a list of all connected cameras
-        camera_list = ctypes.c_void_p(None)
-        status = edsdk_dll.EdsGetCameraList(ctypes.byref(camera_list))
+        camera_list = EdsRef(self.dll, "camera list")
+        status = self.dll.EdsGetCameraList( camera_list.Out() )
         self.Error("EdsGetCameraList", status)
 
         # What are we, rich? We only have one camera so we get the first one
-        status = edsdk_dll.EdsGetChildAtIndex( camera_list,
-                                               0, # index in the list
-                                               ctypes.byref(self.camera) )
+        status = self.dll.EdsGetChildAtIndex( camera_list,
+                                              0, # index in the list
+                                              self.camera.Out() )
         self.Error("EdsGetChildAtIndex", status)
 
         # We don't need the massive list of our one cameras anymore
-        status = edsdk_dll.EdsRelease(camera_list)
+        status = camera_list.Release()
         self.Error("EdsRelease camera_list", status)
 
         # Let's tell the camera we are coming to use it
-        status = edsdk_dll.EdsOpenSession(self.camera)
+        status = self.dll.EdsOpenSession(self.camera)
         self.Error("EdsOpenSession", status)
 
+        # Listen for new files and state changes instead of guessing how long
+        # the camera needs
+        self.events = CameraEvents( self.dll, self.camera, self.Error )
+
+        self.SetSaveTo()
+
         # Set output device to be the computer if not already (check first)
-        status = edsdk_dll.EdsGetPropertyData(
+        status = self.dll.EdsGetPropertyData(
                     self.camera,
                     eds_typ["kEdsPropID_Evf_OutputDevice"],
                     0,
@@ -407,7 +514,7 @@ class CanonLiveView():
 
         if self.device.value == 0: # Output device wasn't the computer
             self.device = ctypes.c_uint( eds_typ["kEdsEvfOutputDevice_PC"] )
-            status = edsdk_dll.EdsSetPropertyData(
+            status = self.dll.EdsSetPropertyData(
                         self.camera,
                         eds_typ["kEdsPropID_Evf_OutputDevice"],
                         0,
@@ -419,144 +526,177 @@ class CanonLiveView():
             time.sleep(2)
 
         # Create the stream that the live preview data will use
-        status = edsdk_dll.EdsCreateMemoryStream( self.buffer_size,
-                                                  ctypes.byref(self.stream) )
+        status = self.dll.EdsCreateMemoryStream( self.buffer_size,
+                                                 self.stream.Out() )
         self.Error("Create memory stream", status)
 
-        # Get the ISO setting
-        status = edsdk_dll.EdsGetPropertyData( self.camera,
-                                               eds_typ["kEdsPropID_ISOSpeed"],
-                                               0,
-                                               ctypes.sizeof(self.prop_iso),
-                                               ctypes.byref(self.prop_iso) )
-        status_msg = "Get ISO setting: %s" % \
-                                           iso[iso_v.index(self.prop_iso.value)]
-        self.Error(status_msg, status)
-        self.data.iso = iso_v.index(self.prop_iso.value)
-
-        # Get the Av setting
-        status = edsdk_dll.EdsGetPropertyData( self.camera,
-                                               eds_typ["kEdsPropID_Av"],
-                                               0,
-                                               ctypes.sizeof(self.prop_av),
-                                               ctypes.byref(self.prop_av) )
-        status_msg = "Get Aperture setting: %s" % \
-                                              av[av_v.index(self.prop_av.value)]
-        self.Error(status_msg, status)
-        self.data.av = av_v.index(self.prop_av.value)
-
-        # Get the Tv setting
-        status = edsdk_dll.EdsGetPropertyData( self.camera,
-                                               eds_typ["kEdsPropID_Tv"],
-                                               0,
-                                               ctypes.sizeof(self.prop_tv),
-                                               ctypes.byref(self.prop_tv) )
-        status_msg = "Get Shutter setting: %s" % \
-                                              tv[tv_v.index(self.prop_tv.value)]
-        self.Error(status_msg, status)
-        self.data.tv = tv_v.index(self.prop_tv.value)
+        # Read the settings we use once; from here on property events keep
+        # them current
+        self.state = CameraState( self.dll,
+                                  self.camera,
+                                  self.events,
+                                  [ eds_typ["kEdsPropID_ISOSpeed"],
+                                    eds_typ["kEdsPropID_Av"],
+                                    eds_typ["kEdsPropID_Tv"],
+                                    eds_typ["kEdsPropID_ImageQuality"] ],
+                                  self.Error )
+        self.writer = SettingsWriter( self.state,
+                                      self.sdk_lock,
+                                      self.SettingConfirmed )
+
+        if c_hlp.verbose:
+            for prop_id, table in ( ( "kEdsPropID_ISOSpeed", iso ),
+                                    ( "kEdsPropID_Av", av ),
+                                    ( "kEdsPropID_Tv", tv ) ):
+                print "%s setting: %s" % ( table.name,
+                                           self.state.Label( eds_typ[prop_id],
+                                                             table ) )
 
     def SavePreviewImage(self):
         f = open("tmp.jpg", "wb")
 
-        f.write( self.StreamToString(self.data.values) )
+        f.write( self.data.jpeg )
 
         f.close()
 
     def SaveImage_SDK(self):
         # This is the way to save the live preview image using the SDK
-        status = edsdk_dll.EdsCreateFileStream( "image.jpg",
-                                                1,
-                                                1,
-                                                ctypes.byref(self.stream) )
+        status = self.dll.EdsCreateFileStream( "image.jpg",
+                                               1,
+                                               1,
+                                               self.stream.Out() )
         self.Error("Save Image", status)
 
-    def StreamToString(self,data):
-        out_string = ''
-        exit_alert = 0
-        for v in data:
-            out_string += chr(v)
-            
-            # look for the end of the file
-            if exit_alert == 0 and v == 255: exit_alert = 1
-
-            elif exit_alert == 1:
-                if v == 217: exit_alert = 2
-                else: exit_alert = 0
-
-            elif exit_alert == 2:
-                if v == 0: exit_alert = 3
-                else: exit_alert = 0
-
-            elif exit_alert == 3:
-                if v == 0: break
-                else: exit_alert = 0
-
-        out_string = out_string[:-2]
-
-        return out_string
-
-    def Take_Picture(self):
-        status = edsdk_dll.EdsSendCommand( self.camera,
-                                           0, # Take Picture Command
-                                           0 )
-
-        # Replace this with a callback check
-        time.sleep(6) # Give camera time to finish it's business
-
-    def Take_RAW_Monochrome(self):
-        """ Take and save a bayer image with 12-bit resolution. """
-        ## Set camera settings to take image
-        # Set Image Quality as RAW if it is not already set
-        prop = ctypes.c_uint( eds_typ["EdsImageQuality_LR"] )
-        out = ctypes.c_uint(0)
-        status = edsdk_dll.EdsGetPropertyData(
+    def SetSaveTo(self):
+        """ Tell the camera where pictures go. Saving to the host skips the
+            card write, the directory walk and the delete: the camera asks us
+            to take the file with a DirItemRequestTransfer event instead. If
+            the camera won't do that we fall back to the card. """
+        if self.save_to == "host":
+            prop = ctypes.c_uint( eds_typ["kEdsSaveTo_Host"] )
+        else:
+            prop = ctypes.c_uint( eds_typ["kEdsSaveTo_Camera"] )
+
+        status = self.dll.EdsSetPropertyData(
                     self.camera,
-                    eds_typ["kEdsPropID_ImageQuality"],
+                    eds_typ["kEdsPropID_SaveTo"],
                     0,
-                    ctypes.sizeof(out),
-                    ctypes.byref(out) )
-
-        if out.value != prop.value:
-            status = edsdk_dll.EdsSetPropertyData(
-                        self.camera,
-                        eds_typ["kEdsPropID_ImageQuality"],
-                        0,
-                        ctypes.sizeof(prop),
-                        ctypes.byref(prop) )
+                    ctypes.sizeof(prop),
+                    ctypes.byref(prop) )
+
+        if status != 0 and self.save_to == "host":
+            if c_hlp.verbose:
+                print "Camera can't save to the host, using the card"
+            self.save_to = "card"
+            return self.SetSaveTo()
+
+        self.Error( "Save to %s", status, self.save_to )
+
+        if self.save_to == "host":
+            # The camera won't shoot unless it thinks there is room on the
+            # host, so tell it there is plenty
+            capacity = EdsCapacity( 0x7FFFFFFF, 0x1000, 1 )
+            status = self.dll.EdsSetCapacity( self.camera, capacity )
+            self.Error("Set host capacity", status)
+
+    def Take_Picture(self, timeout=15.):
+        """ Take a picture and wait for the camera to report the new file
+            (ready for transfer when saving to the host, written to the card
+            otherwise). Returns the directory item ref of the new file, or
+            None if nothing showed up within timeout seconds. """
+        # Anything still queued belongs to some earlier shot
+        self.events.Clear()
+
+        status = self.dll.EdsSendCommand( self.camera,
+                                          0, # Take Picture Command
+                                          0 )
+        self.Error("Take Picture", status)
+
+        if self.save_to == "host":
+            event = eds_typ["kEdsObjectEvent_DirItemRequestTransfer"]
+        else:
+            event = eds_typ["kEdsObjectEvent_DirItemCreated"]
+
+        file_item = self.events.WaitForObject( event, timeout )
+
+        # Not fatal: when saving to the card the caller can still go and
+        # find the file (see DownloadImage)
+        if file_item is None:
+            print "No new image reported within %.1fs" % timeout
+
+        return file_item
+
+    def Take_RAW_Monochrome(self, timeout=15.):
+        """ Take and save a bayer image with 12-bit resolution. timeout is
+            how long to wait for the camera to report it (see Take_Picture).
+        """
+        ## Set camera settings to take image
+        # Set Image Quality as RAW if it is not already set (the cached
+        # state knows, no need to ask the camera)
+        self.state.Set( eds_typ["kEdsPropID_ImageQuality"],
+                        eds_typ["EdsImageQuality_LR"] )
 
         # Set Picture Style to Monochrome (only affects color jpeg in raw)
         # prop = ctypes.c_uint(0x86)
-        # status = edsdk_dll.EdsSetPropertyData( self.camera,
-        #                                        0x114,
-        #                                        0,
-        #                                        ctypes.sizeof(prop),
-        #                                        ctypes.byref(prop) )
+        # status = self.dll.EdsSetPropertyData( self.camera,
+        #                                       0x114,
+        #                                       0,
+        #                                       ctypes.sizeof(prop),
+        #                                       ctypes.byref(prop) )
 
         ## Take picture
-        self.Take_Picture()
+        file_item = self.Take_Picture(timeout)
 
         ## Reset camera settings for live preview (color)
         # Set Picture Style to Standard
         # prop = ctypes.c_uint(0x81)
-        # status = edsdk_dll.EdsSetPropertyData( self.camera,
-        #                                        0x114,
-        #                                        0,
-        #                                        ctypes.sizeof(prop),
-        #                                        ctypes.byref(prop) )
-
-        self.DownloadImage()
+        # status = self.dll.EdsSetPropertyData( self.camera,
+        #                                       0x114,
+        #                                       0,
+        #                                       ctypes.sizeof(prop),
+        #                                       ctypes.byref(prop) )
+
+        # Fall back to walking the card if the event never came
+        return self.DownloadImage(file_item)
+
+    def SettingConfirmed(self, setting, requested, value, latency):
+        if c_hlp.verbose or value != requested:
+            print "Setting 0x%X: asked for 0x%X, camera has 0x%X (%.0f ms)" % (
+                  setting, requested, value, latency * 1000. )
+            sys.stdout.flush()
+
+    def SettingLabels(self, name, table):
+        """ The label of the value the camera has for setting name (a key of
+            eds_typ) and of the value it is being changed to, if any. """
+        setting = eds_typ[name]
+        pending = self.writer.Pending(setting)
+        if pending is not None:
+            pending = table.Label( table.Index(pending) )
+
+        return self.state.Label( setting, table ), pending
+
+    def StepSetting(self, setting, table, step):
+        """ Move one of ISO Speed, Aperture, Shutter Speed step places along
+            its table (stopping at the ends). Steps start from the value the
+            setting is headed for so holding a key sweeps through them. """
+        code = self.writer.Pending(setting)
+        if code is None:
+            code = self.state.Get(setting)
+
+        try:
+            index = table.Index(code)
+
+        except UnknownPropertyValue as e:
+            # Nowhere to step from; leave the setting as the camera has it
+            print "%s, ignoring the key" % e
+            return
+
+        self.UpdateSetting( setting, table.Code( table.Step( index, step ) ) )
 
     def UpdateSetting(self, setting, value):
         """ Update settings on the camera. Intended for ISO Speed, Aperture,
-            Shutter Speed. """
-        prop = ctypes.c_uint( value )
-        status = edsdk_dll.EdsSetPropertyData(
-                        self.camera,
-                        setting,
-                        0,
-                        ctypes.sizeof(prop),
-                        ctypes.byref(prop) )
+            Shutter Speed. Only queues the change, see SettingsWriter. """
+        self.writer.Request( setting, value )
 
 ###############################################################################
 ###                                                                         ###
@@ -583,6 +723,82 @@ def ArgParser():
     #                      dest    = "depths",
     #                      help    = "The depth(s) to view." )
 
+    parser.add_argument( "--card",
+                         action  = "store_const",
+                         const   = "card",
+                         default = "host",
+                         dest    = "save_to",
+                         help    = "Save pictures to the memory card and " \
+                                   "download them from there instead of " \
+                                   "sending them straight to the computer." )
+
+    parser.add_argument( "--memory",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "in_memory",
+                         help    = "Download captures into memory and hand " \
+                                   "them straight to the processing." )
+
+    parser.add_argument( "--no-archive",
+                         action  = "store_const",
+                         const   = False,
+                         default = True,
+                         dest    = "archive",
+                         help    = "With --memory, don't keep a copy of " \
+                                   "the captures in IM_DIR." )
+
+    parser.add_argument( "--sim",
+                         nargs   = '?',
+                         action  = "store",
+                         const   = "",
+                         default = None,
+                         dest    = "sim",
+                         metavar = "DIR",
+                         help    = "Run against a simulated camera instead " \
+                                   "of the EDSDK, with the jpegs in DIR (or " \
+                                   "synthetic frames) as live view." )
+
+    parser.add_argument( "--metrics",
+                         action  = "store",
+                         default = None,
+                         dest    = "metrics",
+                         metavar = "FILE",
+                         help    = "Time every stage and write the " \
+                                   "latencies and counters to FILE (JSON " \
+                                   "if it ends in .json, Prometheus text " \
+                                   "otherwise, - for stdout) on exit and " \
+                                   "when p is pressed." )
+
+    parser.add_argument( "--auto",
+                         nargs   = '?',
+                         action  = "store",
+                         const   = 5,
+                         default = None,
+                         dest    = "auto",
+                         type    = int,
+                         metavar = "N",
+                         help    = "Capture by itself once the label has " \
+                                   "been sharp and still for N live view " \
+                                   "frames (5 by default)." )
+
+    parser.add_argument( "--sharpness",
+                         action  = "store",
+                         default = 500.,
+                         dest    = "sharpness",
+                         type    = float,
+                         help    = "With --auto, the variance of the " \
+                                   "Laplacian a sharp label has at least." )
+
+    parser.add_argument( "--motion",
+                         action  = "store",
+                         default = 2.,
+                         dest    = "motion",
+                         type    = float,
+                         help    = "With --auto, the mean change (in gray " \
+                                   "levels) between frames a still label " \
+                                   "has at most." )
+
     parser.add_argument( "--debug",
                          action  = "store_const",
                          const   = True,
@@ -607,6 +823,61 @@ def ArgParser():
     c_hlp.debug   = args.debug
     c_hlp.verbose = args.verbose
 
+    return args
+
+def DumpMetrics(engine, file_path):
+    """ Write the stage metrics, with the frame counts of the live view
+        engine as gauges. """
+    for key, value in engine.Stats().iteritems():
+        metrics.Set( "liveview_" + key, value )
+
+    metrics.Dump(file_path)
+
+def InstrumentStages():
+    """ Time the stages a label goes through, from the live view to the
+        normalized capture, and count what comes off the camera. """
+    def Captured(file_item):
+        metrics.Count( "captures" if file_item is not None
+                       else "capture_timeouts" )
+
+    def Downloaded(result):
+        if result is None: return
+
+        file_path, data = result
+        if data is not None:
+            size = len(data)
+        elif os.path.isfile(file_path):
+            size = os.path.getsize(file_path)
+        else:
+            return
+
+        metrics.Count( "downloads" )
+        metrics.Count( "bytes_downloaded", size )
+
+    metrics.Instrument( CanonLiveView, "GrabImage" )
+    metrics.Instrument( LivePreviewImage, "Color" )
+    metrics.Instrument( OverlayCompositor, "Compose" )
+    metrics.Instrument( FocusAnalyzer, "Score" )
+    metrics.Instrument( CanonLiveView, "Take_Picture", count=Captured )
+    metrics.Instrument( CanonLiveView, "FindLastImage" )
+    metrics.Instrument( CanonLiveView, "DownloadImage", count=Downloaded )
+    metrics.Instrument( prep_image, "ConvertRAW_TIFF" )
+    metrics.Instrument( prep_image, "DecodeRAWBuffer" )
+    metrics.Instrument( prep_image, "Normalize" )
+    metrics.Instrument( prep_image, "PrepImage" )
+
+def ReducedDecode():
+    """ Whether cv2.imdecode honors the IMREAD_REDUCED_* flags. Older OpenCV
+        builds only do in imread and decode at full size otherwise. Checked
+        once, on a tiny jpeg. """
+    global reduced_decode
+    if reduced_decode is None:
+        _, jpeg = cv2.imencode( ".jpg", np.zeros( (16, 16), np.uint8 ) )
+        reduced = cv2.imdecode( jpeg, cv2.IMREAD_REDUCED_GRAYSCALE_2 )
+        reduced_decode = reduced.shape == (8, 8)
+
+    return reduced_decode
+
 def Timer(text="Segment"):
     """ Use for evaluating performance. Call in pairs to print out elapsed
         times: Once before the code segment and once after the code segment to
@@ -626,92 +897,107 @@ def Timer(text="Segment"):
         tracker = True
 
 if __name__ == "__main__":
-    
-    canon_lp = CanonLiveView()
+    args = ArgParser()
+
+    if args.sim is not None:
+        c_sdk.UseBackend( canon_sim.SimulatedSDK( frames = args.sim or None ) )
+
+    canon_lp = CanonLiveView( save_to   = args.save_to,
+                              in_memory = args.in_memory,
+                              archive   = args.archive )
+
+    if args.auto is not None:
+        canon_lp.focus = FocusAnalyzer( sharp  = args.sharpness,
+                                        still  = args.motion,
+                                        frames = args.auto )
+
+    # Grabbing and decoding run on their own threads, this one only shows the
+    # newest frame and handles the keys
+    engine = LiveViewEngine(canon_lp)
+    engine.Start()
+
+    if args.metrics is not None:
+        InstrumentStages()
+
+        # Written however the script ends, errors included
+        atexit.register( DumpMetrics, engine, args.metrics )
+
+    # key : ( property, table, step )
+    steps = { ord('a') : ( eds_typ["kEdsPropID_ISOSpeed"], iso, -1 ),
+              ord('q') : ( eds_typ["kEdsPropID_ISOSpeed"], iso, +1 ),
+              ord('s') : ( eds_typ["kEdsPropID_Av"],       av,  -1 ),
+              ord('w') : ( eds_typ["kEdsPropID_Av"],       av,  +1 ),
+              ord('d') : ( eds_typ["kEdsPropID_Tv"],       tv,  -1 ),
+              ord('e') : ( eds_typ["kEdsPropID_Tv"],       tv,  +1 ) }
+
+    display = None # Scaled into again once it has been shown
 
     while True:
         # Timer()
-        live = not live
-
-        canon_lp.GrabImage()
+        frame = engine.Frame()
 
-        canon_lp.data.PopulateImage()
+        if frame is not None:
+            live = not live
 
-        canon_lp.data.Overlay()
+            display = canon_lp.compositor.Compose( frame.Color(),
+                                                   frame.Labels(),
+                                                   live,
+                                                   display )
+            cv2.imshow( "live view", display )
 
-        out_image = cv2.resize( canon_lp.data.image,
-                                None, fx=4, fy=4,
-                                interpolation=cv2.INTER_NEAREST )
+        k = cv2.waitKey(1)
 
-        cv2.imshow( "live view", out_image )
-        k = cv2.waitKey(100)
+        # The label has been sharp and still for long enough (--auto), which
+        # is as good as pressing space
+        if k == -1 and canon_lp.focus is not None and canon_lp.focus.Due():
+            k = ord(' ')
 
         if k == 27 or k == ord('x'): break
 
-        elif k == ord(' '):
-            # Save image for OCR
-            canon_lp.Take_RAW_Monochrome()
+        elif k == -1: continue
+
+        elif k in steps:
+            # Step ISO (a,q), Aperture (s,w) or Shutter Speed (d,e). This only
+            # queues the change, the preview doesn't wait for the camera
+            canon_lp.StepSetting( *steps[k] )
+            continue
+
+        if k == ord(' '):
+            # Save image for OCR. Keep the producer thread off the camera
+            # while we talk to it, but not while we process the capture
+            with engine.sdk_lock:
+                capture = canon_lp.Take_RAW_Monochrome()
+
+            # Not again until the next label goes in
+            if canon_lp.focus is not None:
+                canon_lp.focus.Disarm()
+
+            if capture is not None and capture[1] is not None:
+                # Straight from memory, no round trip through the disk
+                label = prep_image.PrepRAW( capture[1],
+                                            os.path.basename(capture[0]) )
+
+                label = cv2.resize( label,
+                                    None, fx=0.25, fy=0.25,
+                                    interpolation=cv2.INTER_AREA )
+
+                cv2.imshow( "label", label )
+
+        elif k == ord('p') and args.metrics is not None:
+            DumpMetrics( engine, args.metrics )
 
         elif k == ord('m'):
-            # Save Preview image
-            f = open("temp.jpg", "wb")
-            f.write(canon_lp.data.jpeg)
-            f.close()
-
-        elif k == ord('a'):
-            # Decrease ISO
-            canon_lp.data.iso -= 1
-            if canon_lp.data.iso < 0:
-                canon_lp.data.iso = 0
-            else:
-                canon_lp.UpdateSetting( eds_typ["kEdsPropID_ISOSpeed"], 
-                                        iso_v[canon_lp.data.iso] )
-
-        elif k == ord('q'):
-            # Increase ISO
-            canon_lp.data.iso += 1
-            if canon_lp.data.iso >= len(iso):
-                canon_lp.data.iso = len(iso) - 1
-            else:
-                canon_lp.UpdateSetting( eds_typ["kEdsPropID_ISOSpeed"],
-                                        iso_v[canon_lp.data.iso] )
-
-        elif k == ord('s'):
-            # Decrease Aperture
-            canon_lp.data.av -= 1
-            if canon_lp.data.av < 0:
-                canon_lp.data.av = 0
-            else:
-                canon_lp.UpdateSetting( eds_typ["kEdsPropID_Av"], 
-                                        av_v[canon_lp.data.av] )
-
-        elif k == ord('w'):
-            # Increase Aperture
-            canon_lp.data.av += 1
-            if canon_lp.data.av >= len(av):
-                canon_lp.data.av = len(av) - 1
-            else:
-                canon_lp.UpdateSetting( eds_typ["kEdsPropID_Av"],
-                                        av_v[canon_lp.data.av] )
-
-        elif k == ord('d'):
-            # Decrease Shutter Speed
-            canon_lp.data.tv -= 1
-            if canon_lp.data.tv < 0:
-                canon_lp.data.tv = 0
-            else:
-                canon_lp.UpdateSetting( eds_typ["kEdsPropID_Tv"], 
-                                        tv_v[canon_lp.data.tv] )
-
-        elif k == ord('e'):
-            # Increase Shutter Speed
-            canon_lp.data.tv += 1
-            if canon_lp.data.tv >= len(tv):
-                canon_lp.data.tv = len(tv) - 1
-            else:
-                canon_lp.UpdateSetting( eds_typ["kEdsPropID_Tv"],
-                                        tv_v[canon_lp.data.tv] )
+            # Save Preview image; the jpeg is a view of the stream memory the
+            # producer downloads into
+            with engine.sdk_lock:
+                f = open("temp.jpg", "wb")
+                f.write(canon_lp.data.jpeg)
+                f.close()
 
         # Timer()
 
+    engine.Stop()
+
+    c_hlp.PrintStats( "Live view", engine.Stats() )
+
     canon_lp.Cleanup()
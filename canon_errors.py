@@ -1,28 +1,58 @@
 #!/usr/bin/env python
+import canon_headers as c_hdr # Cached header tables
 
 # REQUIRES the canon sdk extracted to this folder with the heirarchy intact
-# starting with the Windows directory. See the error_file path for specifics.
-
-eds_err = {} # this will be dictionary of edsdk errors
-
-# Load Errors from EDSDKErrors.h
-error_file = open("Windows/EDSDK/Header/EDSDKErrors.h", "rb")
-
-header = 20 # ignore the first header lines
-
-line_num = 0  # The current line number as we walk through the file
-for line in error_file:
-    t0 = line.split("#define")
-
-    if ( line_num > header) and ( len(t0) > 1 ):
-        err_type = "EDS_" + t0[1].split("EDS_")[1].split(' ')[0]
-        err_code = "0x" + t0[1].split("0x")[-1].split("L")[0]
-        
-        eds_err[ int(err_code,16) ] = err_type
-
-    line_num += 1
-
-error_file.close()
+# starting with the Windows directory (or the cached table made from it by
+# canon_headers.py). See canon_headers.header_dir for specifics.
+
+def ParseErrors(file_path):
+    """ Return a dictionary of the error names in EDSDKErrors.h by code. """
+    eds_err = {} # this will be dictionary of edsdk errors
+
+    # Load Errors from EDSDKErrors.h
+    error_file = open(file_path, "rb")
+
+    header = 20 # ignore the first header lines
+
+    line_num = 0  # The current line number as we walk through the file
+    for line in error_file:
+        t0 = line.split("#define")
+
+        if ( line_num > header) and ( len(t0) > 1 ):
+            err_type = "EDS_" + t0[1].split("EDS_")[1].split(' ')[0]
+            err_code = "0x" + t0[1].split("0x")[-1].split("L")[0]
+
+            eds_err[ int(err_code,16) ] = err_type
+
+        line_num += 1
+
+    error_file.close()
+
+    return eds_err
+
+# The errors the scripts and canon_sim use, for when there is neither the SDK
+# nor a cached table
+fallback_errors = {
+    0x00000000 : "EDS_ERR_OK",
+    0x00000002 : "EDS_ERR_INTERNAL_ERROR",
+    0x00000007 : "EDS_ERR_NOT_SUPPORTED",
+    0x00000022 : "EDS_ERR_FILE_NOT_FOUND",
+    0x00000023 : "EDS_ERR_FILE_OPEN_ERROR",
+    0x00000040 : "EDS_ERR_DIR_NOT_FOUND",
+    0x00000050 : "EDS_ERR_PROPERTIES_UNAVAILABLE",
+    0x00000060 : "EDS_ERR_INVALID_PARAMETER",
+    0x00000061 : "EDS_ERR_INVALID_HANDLE",
+    0x00000062 : "EDS_ERR_INVALID_POINTER",
+    0x00000063 : "EDS_ERR_INVALID_INDEX",
+    0x00000080 : "EDS_ERR_DEVICE_NOT_FOUND",
+    0x00000081 : "EDS_ERR_DEVICE_BUSY",
+    0x0000A102 : "EDS_ERR_OBJECT_NOTREADY" }
+
+# The dictionary of edsdk errors, parsed (or loaded from its cache) on first
+# use
+eds_err = c_hdr.LazyTable( c_hdr.Header("EDSDKErrors.h"),
+                           ParseErrors,
+                           fallback_errors )
 
 if __name__ == "__main__":
     # Print a list of the errors in numerical order
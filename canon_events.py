@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+    EDSDK event handling. The SDK tells us about new files on the card,
+    property changes and camera state changes through callbacks, but only
+    delivers them while somebody calls EdsGetEvent. CameraEvents registers
+    the callbacks, queues what comes in and pumps EdsGetEvent while waiting
+    for a particular event. Property events are passed straight on to
+    whoever listens for them (see canon_state).
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import ctypes
+import time
+
+from canon_refs import EdsRef # Owned EDSDK references
+from canon_sdk import EdsObjectEventHandler, EdsPropertyEventHandler, \
+                      EdsStateEventHandler # Callback prototypes
+from canon_types import eds_typ # EDSDK Types from the types header
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class CameraEvents():
+    """ Collect the object and state events of one camera. Events are queued
+        as (kind, event, arg) tuples where kind is "object" or "state" and arg
+        is the directory item ref or the state parameter. Object refs belong
+        to us once they are delivered, so anything we throw away is released.
+    """
+
+    def __init__(self, dll, camera, error=None):
+        self.camera    = camera
+        self.dll       = dll
+        self.error     = error
+        self.listeners = [] # Called with (event, property id, param)
+        self.queue     = []
+
+        # Keep references to the callbacks, ctypes doesn't and the SDK would
+        # end up calling freed memory
+        self.on_object   = EdsObjectEventHandler(self.ObjectEvent)
+        self.on_property = EdsPropertyEventHandler(self.PropertyEvent)
+        self.on_state    = EdsStateEventHandler(self.StateEvent)
+
+        status = self.dll.EdsSetObjectEventHandler(
+                    self.camera,
+                    eds_typ["kEdsObjectEvent_All"],
+                    self.on_object,
+                    None )
+        self.Error("Set object event handler", status)
+
+        status = self.dll.EdsSetPropertyEventHandler(
+                    self.camera,
+                    eds_typ["kEdsPropertyEvent_All"],
+                    self.on_property,
+                    None )
+        self.Error("Set property event handler", status)
+
+        status = self.dll.EdsSetCameraStateEventHandler(
+                    self.camera,
+                    eds_typ["kEdsStateEvent_All"],
+                    self.on_state,
+                    None )
+        self.Error("Set state event handler", status)
+
+    def AddPropertyListener(self, listener):
+        self.listeners.append(listener)
+
+    def Clear(self):
+        """ Forget (and release) everything that arrived so far. """
+        self.Pump()
+
+        for kind, event, arg in self.queue:
+            if kind == "object" and arg:
+                self.dll.EdsRelease( ctypes.c_void_p(arg) )
+
+        self.queue = []
+
+    def Close(self):
+        self.Clear()
+
+        status = self.dll.EdsSetObjectEventHandler(
+                    self.camera,
+                    eds_typ["kEdsObjectEvent_All"],
+                    None,
+                    None )
+        self.Error("Remove object event handler", status)
+
+        status = self.dll.EdsSetPropertyEventHandler(
+                    self.camera,
+                    eds_typ["kEdsPropertyEvent_All"],
+                    None,
+                    None )
+        self.Error("Remove property event handler", status)
+
+        status = self.dll.EdsSetCameraStateEventHandler(
+                    self.camera,
+                    eds_typ["kEdsStateEvent_All"],
+                    None,
+                    None )
+        self.Error("Remove state event handler", status)
+
+    def Error(self, msg, status, *args):
+        if self.error is not None:
+            self.error( msg, status, *args )
+
+    def ObjectEvent(self, event, ref, context):
+        self.queue.append( ( "object", event, ref ) )
+        return 0
+
+    def PropertyEvent(self, event, prop_id, param, context):
+        for listener in self.listeners:
+            listener( event, prop_id, param )
+
+        return 0
+
+    def Pump(self):
+        """ Let the SDK deliver whatever events it is holding. """
+        self.dll.EdsGetEvent()
+
+    def StateEvent(self, event, param, context):
+        self.queue.append( ( "state", event, param ) )
+        return 0
+
+    def WaitForObject(self, event, timeout, poll=0.01):
+        """ Pump events until an object event of the given type shows up and
+            return its ref (an EdsRef the caller releases). Returns None on
+            timeout or if the camera reports a capture error first. Other
+            events that arrive in the meantime stay queued. """
+        capture_error = eds_typ["kEdsStateEvent_CaptureError"]
+        t_end = time.time() + timeout
+
+        while True:
+            self.Pump()
+
+            for i, ( kind, evt, arg ) in enumerate(self.queue):
+                if kind == "object" and evt == event:
+                    del self.queue[i]
+                    return EdsRef( self.dll, "object event", arg )
+
+                if kind == "state" and evt == capture_error:
+                    del self.queue[i]
+                    return None
+
+            if time.time() >= t_end:
+                return None
+
+            time.sleep(poll)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+    Focus and stability of the label in the live view. FocusAnalyzer scores
+    every frame inside the label circle only, on the reduced grayscale
+    decode: sharpness is the variance of the Laplacian (an out of focus
+    label has no edges left), motion the mean absolute difference from the
+    previous frame. Once the label has been sharp and still for a number of
+    frames in a row a capture is due, so the operator only has to put the
+    record down.
+
+    At 1/4 scale the circle is about 170 pixels across and both scores take
+    well under a millisecond.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import canon_helpers as c_hlp # Our helpers
+from canon_overlay import LabelRadius # The circle the label goes in
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class FocusAnalyzer():
+    """ Score frames (LivePreviewImage) for sharpness and motion and decide
+        when to capture. A capture is due after frames frames in a row with
+        a sharpness of at least sharp and a motion of at most still. It stays
+        due (see Due) however many frames go by, or get dropped, until the
+        UI thread has made the capture and called Disarm, which also keeps
+        the analyzer from firing again until the label has moved (motion
+        above moved, a new record going in) and cooldown seconds have
+        passed, so the same label isn't captured twice. Only call Update
+        from one thread (the decoder); Due and Disarm are for the UI. """
+
+    def __init__(self, sharp=500., still=2., frames=5, moved=8.,
+                 cooldown=2., scale=4):
+        self.armed    = True
+        self.cooldown = cooldown
+        self.due      = threading.Event() # A capture is waiting for the UI
+        self.frames   = frames
+        self.lock     = threading.Lock() # Around armed, steady and t_fired
+        self.masks    = {} # reduced frame size : ( crop slices, mask )
+        self.moved    = moved
+        self.previous = None # The last crop, for the motion
+        self.scale    = scale
+        self.sharp    = sharp
+        self.steady   = 0 # Frames in a row that were sharp and still
+        self.still    = still
+        self.t_fired  = 0.
+
+        self.motion    = 0. # The scores of the last frame
+        self.sharpness = 0.
+        self.triggers  = 0 # Captures asked for
+
+    def Due(self):
+        """ Whether a capture is due, for the UI thread. """
+        return self.due.is_set()
+
+    def Disarm(self):
+        """ Don't trigger again until the label has moved, and forget any
+            capture that was due. Call after every capture, automatic or by
+            hand. """
+        with self.lock:
+            self.armed   = False
+            self.steady  = 0
+            self.t_fired = time.time()
+
+            self.due.clear()
+
+    def Mask(self, size):
+        """ The square around the label circle in a reduced frame of size
+            (height, width), as slices, and the circle as a mask of it. """
+        if size not in self.masks:
+            height, width = size
+            r = max( 1, LabelRadius(height) )
+            y_c, x_c = height // 2, width // 2
+
+            crop = ( slice( max( 0, y_c - r ), y_c + r + 1 ),
+                     slice( max( 0, x_c - r ), x_c + r + 1 ) )
+
+            mask = np.zeros( ( height, width ), np.uint8 )
+            cv2.circle( mask, ( x_c, y_c ), r, 255, -1 )
+
+            self.masks[size] = ( crop, mask[crop].copy() )
+
+        return self.masks[size]
+
+    def Score(self, gray):
+        """ The sharpness and motion of the label in gray, a reduced
+            grayscale frame. Motion is 0 for the first frame. """
+        crop, mask = self.Mask( gray.shape )
+        label = gray[crop]
+
+        laplacian = cv2.Laplacian( label, cv2.CV_16S )
+        _, std = cv2.meanStdDev( laplacian, mask=mask )
+        sharpness = float( std[0, 0] ) ** 2
+
+        motion = 0.
+        if self.previous is not None and \
+           self.previous.shape == label.shape:
+            motion = cv2.mean( cv2.absdiff( label, self.previous ),
+                               mask=mask )[0]
+
+        self.previous = label
+
+        return sharpness, motion
+
+    def Update(self, frame):
+        """ Score frame and return whether that made a capture due. The
+            scores are left in frame.sharpness and frame.motion. """
+        self.sharpness, self.motion = self.Score( frame.Gray(self.scale) )
+        frame.sharpness = self.sharpness
+        frame.motion    = self.motion
+
+        with self.lock:
+            if self.due.is_set(): return False
+
+            if not self.armed:
+                if self.motion > self.moved and \
+                   time.time() - self.t_fired > self.cooldown:
+                    self.armed = True
+
+                return False
+
+            if self.sharpness >= self.sharp and self.motion <= self.still:
+                self.steady += 1
+            else:
+                self.steady = 0
+
+            if self.steady < self.frames: return False
+
+            # Until the UI has captured, whatever happens to this frame
+            self.armed  = False
+            self.steady = 0
+            self.due.set()
+
+        if c_hlp.verbose:
+            print "Label steady: sharpness %.0f, motion %.2f" % (
+                  self.sharpness, self.motion )
+
+        self.triggers += 1
+
+        return True
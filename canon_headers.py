@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+    Cached tables of the constants in the EDSDK headers. Parsing
+    EDSDKTypes.h and EDSDKErrors.h takes a while and needs the SDK next to
+    the scripts, so the parsed tables are pickled next to this file along
+    with the SHA1 of the header they came from. A table is only loaded (or
+    parsed, when its header changed) the first time it is used.
+
+    Run this script to (re)generate the cached tables from the headers, e.g.
+    after updating the SDK.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import collections
+import cPickle as pickle
+import hashlib
+import os
+import sys
+import time
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+# The headers are looked for relative to this file, not the cwd
+here       = os.path.dirname( os.path.abspath(__file__) )
+header_dir = os.path.join( here, "Windows", "EDSDK", "Header" )
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class LazyTable(collections.Mapping):
+    """ A read only dict of the constants in one EDSDK header, loaded on
+        first use. parse(path) turns the header into a dict; its result is
+        cached in <header name>.pickle next to this file and reused for as
+        long as the header's hash matches. If the header isn't there at all
+        the cached table is used as is, and without a cache the fallback
+        dict (if any), so the scripts can run against canon_sim on a machine
+        that never had the SDK. """
+
+    def __init__(self, header, parse, fallback=None):
+        self.cache    = os.path.join( here, os.path.basename(header) +
+                                      ".pickle" )
+        self.fallback = fallback
+        self.header   = header
+        self.parse    = parse
+        self.table    = None
+
+    def __getitem__(self, key):
+        if self.table is None: self.Load()
+        return self.table[key]
+
+    def __iter__(self):
+        if self.table is None: self.Load()
+        return iter(self.table)
+
+    def __len__(self):
+        if self.table is None: self.Load()
+        return len(self.table)
+
+    def Generate(self):
+        """ Parse the header and cache the result, whatever is cached. If
+            the cache can't be written (e.g. a read only install) the table
+            is only kept in memory. """
+        if not os.path.exists(self.header):
+            raise IOError( "%s not found; the EDSDK has to be extracted " \
+                           "next to the scripts" % self.header )
+
+        digest = FileHash(self.header)
+        self.table = self.parse(self.header)
+
+        try:
+            with open( self.cache, "wb" ) as f:
+                pickle.dump( ( digest, self.table ), f,
+                             pickle.HIGHEST_PROTOCOL )
+
+        except ( IOError, OSError ) as e:
+            print "Not caching %s: %s" % ( self.header, e )
+
+            # Don't leave half a pickle behind for the next Load
+            if os.path.exists(self.cache):
+                try:
+                    os.remove(self.cache)
+                except OSError:
+                    pass
+
+        return self.table
+
+    def Load(self):
+        cached = None
+        if os.path.exists(self.cache):
+            with open( self.cache, "rb" ) as f:
+                cached = pickle.load(f)
+
+        if not os.path.exists(self.header):
+            if cached is None and self.fallback is not None:
+                self.table = dict(self.fallback)
+
+            elif cached is None:
+                raise IOError( "%s not found and no cached table in %s; " \
+                               "the EDSDK has to be extracted next to the " \
+                               "scripts" % ( self.header, self.cache ) )
+
+            else:
+                self.table = cached[1]
+
+        elif cached is not None and cached[0] == FileHash(self.header):
+            self.table = cached[1]
+
+        else:
+            self.Generate()
+
+        return self.table
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def FileHash(file_path):
+    """ Return the SHA1 of the contents of a file. """
+    with open( file_path, "rb" ) as f:
+        return hashlib.sha1( f.read() ).hexdigest()
+
+def Header(name):
+    """ The path of one of the EDSDK headers. """
+    return os.path.join( header_dir, name )
+
+if __name__ == "__main__":
+    from canon_errors import eds_err
+    from canon_types import eds_typ
+
+    failed = False
+    for table in ( eds_typ, eds_err ):
+        t0 = time.time()
+        try:
+            table.Generate()
+
+        except IOError as e:
+            print e
+            failed = True
+            continue
+
+        print "%s: %i entries in %.3fs -> %s" % ( table.header,
+                                                   len(table),
+                                                   time.time() - t0,
+                                                   table.cache )
+
+    if failed: sys.exit(1)
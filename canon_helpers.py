@@ -1,6 +1,42 @@
+import ctypes
+import numpy as np
+
 debug = False
 verbose = True
 
+def BufferView(pointer, length):
+    """ Wrap length bytes of memory starting at pointer (an address such as
+        the one EdsGetPointer hands back) in a numpy uint8 array without
+        copying anything. The array is only valid for as long as the memory
+        behind it is: the next download into the same stream overwrites it,
+        so copy it if it has to outlive the frame. """
+    if not pointer or length == 0:
+        return np.zeros(0, np.uint8)
+
+    data = ctypes.cast( pointer, ctypes.POINTER(ctypes.c_ubyte) )
+
+    return np.ctypeslib.as_array( data, shape=(length,) )
+
+
+def PrintStats(name, stats):
+    """ Print the frame counters of the live view engine on one line. """
+    import sys
+
+    print "%s (%.1fs): grabbed %i (%.1f fps), unique %i (%.1f fps), " \
+          "decoded %i, displayed %i (%.1f fps), dropped %i" % (
+          name,
+          stats["elapsed"],
+          stats["grabbed"],
+          stats["grab_fps"],
+          stats["unique"],
+          stats["unique_fps"],
+          stats["decoded"],
+          stats["displayed"],
+          stats["fps"],
+          stats["dropped"] )
+
+    sys.stdout.flush()
+
 def ProcessError(message, error=0, dll=None):
     """ Give some feedback to the user when an error is encountered and make
         it pretty; then exit. """
@@ -81,4 +117,35 @@ def ProcessError(message, error=0, dll=None):
 
         print outString
 
-        sys.stdout.flush()
\ No newline at end of file
+        sys.stdout.flush()
+
+def ScanJPEG(data):
+    """ Walk a pointer to unsigned bytes one value at a time until the jpeg end
+        of image marker followed by two zero bytes (FF D9 00 00) shows up and
+        return everything up to and including the marker as a string. This is
+        slow (a python loop per byte) and is only kept as a fallback for
+        streams that can't report their length and as the reference for the
+        benchmarks. """
+    out_string = ''
+    exit_alert = 0
+    for v in data:
+        out_string += chr(v)
+
+        # look for the end of the file
+        if exit_alert == 0 and v == 255: exit_alert = 1
+
+        elif exit_alert == 1:
+            if v == 217: exit_alert = 2
+            else: exit_alert = 0
+
+        elif exit_alert == 2:
+            if v == 0: exit_alert = 3
+            else: exit_alert = 0
+
+        elif exit_alert == 3:
+            if v == 0: break
+            else: exit_alert = 0
+
+    out_string = out_string[:-2]
+
+    return out_string
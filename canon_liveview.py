@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+    Threaded live view engine. One thread pulls EVF frames from the camera, a
+    second decodes them and draws the overlay and the caller (the UI thread)
+    only has to show whatever frame is newest and handle the keys.
+
+    The camera object only needs two methods:
+        GrabFrame()       -> jpeg bytes that the caller is free to keep
+        DecodeFrame(jpeg) -> the decoded frame that gets handed to the UI
+    CanonLiveView in canon_cam.py and FakeCamera in canon_sim.py both have
+    them.
+
+    Grabbing faster than the camera makes new frames gets the same frame
+    again. The producer recognizes those by a cheap fingerprint of the jpeg
+    (see Fingerprint) and drops them before they cost a decode and an
+    overlay.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import argparse
+import ctypes
+import sys
+import threading
+import time
+import zlib
+
+import canon_helpers as c_hlp # Our helpers
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class LatestQueue():
+    """ A bounded hand-off between two threads that never blocks the producer.
+        When the queue is full the oldest item is thrown away to make room for
+        the new one so the consumer always gets the newest frame. The number
+        of items thrown away is kept in dropped. """
+
+    def __init__(self, size=1):
+        self.cond    = threading.Condition()
+        self.dropped = 0
+        self.items   = []
+        self.size    = size
+
+    def Get(self, timeout=None):
+        """ Return the oldest item, waiting up to timeout seconds for one.
+            Returns None if nothing showed up in time. """
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+
+            if not self.items:
+                return None
+
+            return self.items.pop(0)
+
+    def Put(self, item):
+        with self.cond:
+            if len(self.items) >= self.size:
+                self.items.pop(0)
+                self.dropped += 1
+
+            self.items.append(item)
+            self.cond.notify()
+
+
+class LiveViewEngine():
+    """ Run the grab and decode stages of the live view on their own threads.
+        sdk_lock is held while a frame is being grabbed; hold it yourself
+        around any other camera call made while the engine is running. It is
+        the camera's own sdk_lock if it has one, so other threads talking to
+        the camera can share it. With dedupe, a frame that is the same as the
+        one before it is counted as repeated and goes no further.
+
+        A frame that fails to decode is skipped (and counted as corrupt),
+        unless max_corrupt of them fail in a row. Anything else that ends
+        one of the threads, SystemExit from a failed EDSDK call included,
+        stops the engine and is raised again by Frame on the UI thread. """
+
+    def __init__(self, camera, queue_size=1, dedupe=True, max_corrupt=10):
+        self.camera   = camera
+        self.decoded  = LatestQueue(queue_size)
+        self.dedupe   = dedupe
+        self.error    = None # sys.exc_info() of what stopped a thread
+        self.grabbed  = LatestQueue(queue_size)
+        self.last     = None # Fingerprint of the last frame passed on
+        self.max_corrupt = max_corrupt
+        self.running  = False
+        self.sdk_lock = getattr( camera, "sdk_lock", None ) or \
+                        threading.RLock()
+        self.threads  = []
+
+        self.n_corrupt   = 0
+        self.n_decoded   = 0
+        self.n_displayed = 0
+        self.n_grabbed   = 0
+        self.n_repeated  = 0
+        self.t_start     = 0
+
+    def Decoder(self):
+        in_a_row = 0 # Corrupt frames
+        while self.running:
+            jpeg = self.grabbed.Get(0.1)
+            if jpeg is None: continue
+
+            try:
+                frame = self.camera.DecodeFrame(jpeg)
+            except Exception:
+                self.n_corrupt += 1
+                in_a_row += 1
+                if in_a_row >= self.max_corrupt: raise
+                continue
+
+            in_a_row = 0
+
+            self.decoded.Put(frame)
+            self.n_decoded += 1
+
+    def Frame(self, timeout=0.1):
+        """ Return the newest decoded frame (None if there was nothing new
+            within timeout seconds). Call this from the UI thread. If one of
+            the threads died, the engine is stopped and what killed it is
+            raised here. """
+        self.RaiseError()
+
+        frame = self.decoded.Get(timeout)
+        if frame is None:
+            self.RaiseError()
+
+        if frame is not None:
+            self.n_displayed += 1
+
+        return frame
+
+    def Producer(self):
+        # The EDSDK is COM based on Windows; every thread that talks to it has
+        # to initialize COM first
+        if sys.platform == "win32":
+            ctypes.windll.ole32.CoInitializeEx(None, 0)
+
+        while self.running:
+            with self.sdk_lock:
+                jpeg = self.camera.GrabFrame()
+
+            if jpeg is None: continue
+
+            self.n_grabbed += 1
+
+            if self.dedupe:
+                fingerprint = Fingerprint(jpeg)
+                if fingerprint == self.last:
+                    self.n_repeated += 1
+                    continue
+
+                self.last = fingerprint
+
+            self.grabbed.Put(jpeg)
+
+    def RaiseError(self):
+        """ Stop and raise what ended a thread, if anything did. """
+        if self.error is None: return
+
+        self.Stop()
+
+        error, self.error = self.error, None
+        raise error[0], error[1], error[2]
+
+    def Run(self, stage):
+        """ Run a stage (Producer or Decoder) and keep whatever ends it
+            early for RaiseError. """
+        try:
+            stage()
+        except BaseException:
+            if self.error is None:
+                self.error = sys.exc_info()
+            self.running = False
+
+    def Start(self):
+        self.error   = None
+        self.running = True
+        self.t_start = time.time()
+
+        self.threads = [ threading.Thread( target=self.Run,
+                                           args=(self.Producer,),
+                                           name="evf producer" ),
+                         threading.Thread( target=self.Run,
+                                           args=(self.Decoder,),
+                                           name="evf decoder" ) ]
+
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def Stats(self):
+        """ Frame counts and rates since Start. Repeated frames are grabs
+            that got the previous frame again, unique ones the rest (what the
+            camera really delivered), corrupt ones those that didn't decode.
+            Dropped frames are the ones that were
+            overwritten in either queue before anyone used them. """
+        elapsed = max( time.time() - self.t_start, 1e-6 )
+        unique  = self.n_grabbed - self.n_repeated
+
+        return { "elapsed"    : elapsed,
+                 "grabbed"    : self.n_grabbed,
+                 "repeated"   : self.n_repeated,
+                 "corrupt"    : self.n_corrupt,
+                 "unique"     : unique,
+                 "decoded"    : self.n_decoded,
+                 "displayed"  : self.n_displayed,
+                 "dropped"    : self.grabbed.dropped + self.decoded.dropped,
+                 "grab_fps"   : self.n_grabbed / elapsed,
+                 "unique_fps" : unique / elapsed,
+                 "fps"        : self.n_displayed / elapsed }
+
+    def Stop(self):
+        self.running = False
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def ArgParser():
+    """ This function will handle the input arguments while keeping the main
+        function tidy. """
+
+    usage = """
+    canon_liveview.py [-f FPS] [-s SECONDS] [--headless]
+
+    Run the live view engine against the fake camera from canon_sim.py and
+    report the frame rate it achieves.
+
+            """
+
+    parser = argparse.ArgumentParser( description = "Live view engine",
+                                      usage = usage)
+
+    parser.add_argument( "-f",
+                         action  = "store",
+                         default = 30.,
+                         dest    = "fps",
+                         type    = float,
+                         help    = "Frame rate of the fake camera." )
+
+    parser.add_argument( "--headless",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "headless",
+                         help    = "Don't open a window." )
+
+    parser.add_argument( "-s",
+                         action  = "store",
+                         default = 5.,
+                         dest    = "seconds",
+                         type    = float,
+                         help    = "How long to run for." )
+
+    return parser.parse_args()
+
+def Fingerprint(jpeg, blocks=8, size=64):
+    """ A cheap identity of a jpeg (str or uint8 array): its length and a
+        crc of blocks bytes samples spread over it, the last one ending at
+        the end of the image. A changed frame changes the entropy coded
+        data from the first changed block on and nearly always the length,
+        so this catches it without reading the whole buffer (a few us
+        against milliseconds for a decode). """
+    if blocks < 1:
+        raise ValueError( "Fingerprint needs at least one block" )
+
+    n = len(jpeg)
+    data = buffer(jpeg)
+
+    # A single block is the one at the end
+    last = max( 0, n - size )
+    if blocks == 1:
+        starts = [ last ]
+    else:
+        starts = [ last * i // ( blocks - 1 ) for i in range(blocks) ]
+
+    crc = 0
+    for start in starts:
+        crc = zlib.crc32( buffer( data, start, size ), crc )
+
+    return n, crc
+
+if __name__ == "__main__":
+    import canon_sim
+
+    args = ArgParser()
+
+    engine = LiveViewEngine( canon_sim.FakeCamera( fps=args.fps ) )
+    engine.Start()
+
+    t_end = time.time() + args.seconds
+    while time.time() < t_end:
+        frame = engine.Frame()
+
+        if args.headless or frame is None: continue
+
+        import cv2
+        cv2.imshow( "fake live view", frame )
+        k = cv2.waitKey(1)
+
+        if k == 27 or k == ord('x'): break
+
+    engine.Stop()
+
+    c_hlp.PrintStats( "Live view", engine.Stats() )
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+    Ownership of EDSDK references (EdsBaseRef and everything derived from
+    it: the camera, volumes, directory items, streams, EVF images). Every
+    ref the SDK hands out has to be given back with EdsRelease or the SDK
+    holds on to it (and whatever it points at) for good. EdsRef holds one
+    such reference and gives it back when it is released explicitly, at the
+    end of a with block or, as a last resort, when it is garbage collected.
+
+    LiveRefs counts the references currently held, so a test against a fake
+    SDK can check that a piece of code gives back everything it took.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import ctypes
+import weakref
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+collected = 0 # References only given back by the garbage collector (leaks)
+invalid   = 0x61 # EDS_ERR_INVALID_HANDLE
+refs      = weakref.WeakSet() # Every EdsRef still around
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class EdsRef():
+    """ One EDSDK reference. Pass it to EDSDK calls as is (ctypes uses the
+        c_void_p in ref), pass Out() where the SDK returns a new reference,
+        and Release it (or use it as a context manager) when done. Retain
+        makes a second owner of the same SDK object, which the SDK counts
+        separately. """
+
+    def __init__(self, dll, name="ref", value=None):
+        self.dll  = dll
+        self.name = name
+        self.ref  = ctypes.c_void_p(value)
+
+        # What ctypes passes when this object is an argument of a call
+        self._as_parameter_ = self.ref
+
+        refs.add(self)
+
+    def __del__(self):
+        global collected
+        if self.ref.value:
+            collected += 1
+            try:
+                self.Release()
+            except Exception:
+                pass # The SDK may already be gone at exit
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Release()
+
+    def __nonzero__(self):
+        return bool(self.ref.value)
+
+    def __repr__(self):
+        return "<EdsRef %s 0x%X>" % ( self.name, self.ref.value or 0 )
+
+    def Out(self):
+        """ Give back whatever this holds and return a pointer for the SDK to
+            store a new reference in. """
+        self.Release()
+
+        return ctypes.byref(self.ref)
+
+    def Release(self):
+        """ Give the reference back to the SDK (if there is one). Returns an
+            EDSDK status. """
+        if not self.ref.value: return 0
+
+        # EdsRelease returns how many references to the object are left, or
+        # 0xFFFFFFFF if it wasn't a valid one
+        left = self.dll.EdsRelease(self.ref)
+        self.ref.value = None
+
+        return invalid if left == 0xFFFFFFFF else 0
+
+    def Retain(self):
+        """ Return a new EdsRef owning another reference to the same object.
+        """
+        self.dll.EdsRetain(self.ref)
+
+        return EdsRef( self.dll, self.name, self.ref.value )
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def LiveRefs():
+    """ The number of references currently held by EdsRef objects. """
+    return sum( 1 for ref in list(refs) if ref.ref.value )
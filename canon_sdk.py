@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+    The ctypes binding to the EDSDK. LoadEDSDK loads EDSDK.dll once and
+    declares the prototype of every function the scripts call, so ctypes
+    checks and converts the arguments the same way on every call instead of
+    guessing (ints for pointers, 32 vs 64 bit sizes, struct arguments).
+
+    Everything else gets at the SDK through the object LoadEDSDK returns.
+    Anything with the same Eds* methods can stand in for the DLL: hand it to
+    UseBackend before the camera is opened and it is used instead (see
+    canon_sim for the fakes).
+
+    Check is the status check every call goes through. A successful call
+    costs one comparison; the message is only put together when there is
+    something to print.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import ctypes
+
+import canon_helpers as c_hlp # Our helpers
+from canon_errors import eds_err # EDSDK Errors from the errors header
+from canon_types import EdsCapacity, EdsDirectoryItemInfo
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+dll      = None # The loaded EDSDK (or whatever stands in for it)
+dll_path = "EDSDK\\EDSDK.dll"
+
+# The basic EDSDK types (EDSDKTypes.h)
+EdsBaseRef = ctypes.c_void_p
+EdsError   = ctypes.c_uint
+EdsInt32   = ctypes.c_int
+EdsUInt32  = ctypes.c_uint
+EdsUInt64  = ctypes.c_ulonglong
+
+# EDSCALLBACK is __stdcall on Windows
+FUNCTYPE = getattr(ctypes, "WINFUNCTYPE", ctypes.CFUNCTYPE)
+
+# EdsError (event, ref, context)
+EdsObjectEventHandler   = FUNCTYPE( EdsError,
+                                    EdsUInt32,
+                                    EdsBaseRef,
+                                    ctypes.c_void_p )
+# EdsError (event, property id, param, context)
+EdsPropertyEventHandler = FUNCTYPE( EdsError,
+                                    EdsUInt32,
+                                    EdsUInt32,
+                                    EdsUInt32,
+                                    ctypes.c_void_p )
+# EdsError (event, param, context)
+EdsStateEventHandler    = FUNCTYPE( EdsError,
+                                    EdsUInt32,
+                                    EdsUInt32,
+                                    ctypes.c_void_p )
+
+# One of the handlers above, or None to remove it; ctypes won't take None
+# for a FUNCTYPE argument
+handler = ctypes.c_void_p
+ref_out = ctypes.POINTER(EdsBaseRef) # Where the SDK stores a new reference
+
+# name : ( restype, argtypes ) of every EDSDK function we call
+prototypes = {
+    "EdsCloseSession"               : ( EdsError, [EdsBaseRef] ),
+    "EdsCreateEvfImageRef"          : ( EdsError, [EdsBaseRef, ref_out] ),
+    "EdsCreateFileStream"           : ( EdsError,
+                                        [ctypes.c_char_p,
+                                         ctypes.c_int, # CreateDisposition
+                                         ctypes.c_int, # Access
+                                         ref_out] ),
+    "EdsCreateMemoryStream"         : ( EdsError, [EdsUInt64, ref_out] ),
+    "EdsDeleteDirectoryItem"        : ( EdsError, [EdsBaseRef] ),
+    "EdsDownload"                   : ( EdsError,
+                                        [EdsBaseRef, EdsUInt64, EdsBaseRef] ),
+    "EdsDownloadComplete"           : ( EdsError, [EdsBaseRef] ),
+    "EdsDownloadEvfImage"           : ( EdsError, [EdsBaseRef, EdsBaseRef] ),
+    "EdsGetCameraList"              : ( EdsError, [ref_out] ),
+    "EdsGetChildAtIndex"            : ( EdsError,
+                                        [EdsBaseRef, EdsInt32, ref_out] ),
+    "EdsGetChildCount"              : ( EdsError,
+                                        [EdsBaseRef,
+                                         ctypes.POINTER(EdsUInt32)] ),
+    "EdsGetDirectoryItemInfo"       : ( EdsError,
+                                        [EdsBaseRef,
+                                         ctypes.POINTER(EdsDirectoryItemInfo)]
+                                      ),
+    "EdsGetEvent"                   : ( EdsError, [] ),
+    "EdsGetLength"                  : ( EdsError,
+                                        [EdsBaseRef,
+                                         ctypes.POINTER(EdsUInt64)] ),
+    "EdsGetPointer"                 : ( EdsError,
+                                        [EdsBaseRef,
+                                         ctypes.POINTER(ctypes.c_void_p)] ),
+    "EdsGetPropertyData"            : ( EdsError,
+                                        [EdsBaseRef,
+                                         EdsUInt32, # property id
+                                         EdsInt32,  # param
+                                         EdsUInt32, # size
+                                         ctypes.c_void_p] ),
+    "EdsInitializeSDK"              : ( EdsError, [] ),
+    "EdsOpenSession"                : ( EdsError, [EdsBaseRef] ),
+    # Not an EdsError: the references left, 0xFFFFFFFF on failure
+    "EdsRelease"                    : ( EdsUInt32, [EdsBaseRef] ),
+    "EdsRetain"                     : ( EdsUInt32, [EdsBaseRef] ),
+    "EdsSendCommand"                : ( EdsError,
+                                        [EdsBaseRef, EdsUInt32, EdsInt32] ),
+    "EdsSetCameraStateEventHandler" : ( EdsError,
+                                        [EdsBaseRef,
+                                         EdsUInt32,
+                                         handler,
+                                         ctypes.c_void_p] ),
+    "EdsSetCapacity"                : ( EdsError, [EdsBaseRef, EdsCapacity] ),
+    "EdsSetObjectEventHandler"      : ( EdsError,
+                                        [EdsBaseRef,
+                                         EdsUInt32,
+                                         handler,
+                                         ctypes.c_void_p] ),
+    "EdsSetPropertyData"            : ( EdsError,
+                                        [EdsBaseRef,
+                                         EdsUInt32, # property id
+                                         EdsInt32,  # param
+                                         EdsUInt32, # size
+                                         ctypes.c_void_p] ),
+    "EdsSetPropertyEventHandler"    : ( EdsError,
+                                        [EdsBaseRef,
+                                         EdsUInt32,
+                                         handler,
+                                         ctypes.c_void_p] ),
+    "EdsTerminateSDK"               : ( EdsError, [] ) }
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def Check(status, msg, *args):
+    """ Report the status of an EDSDK call: exit with the decoded error if
+        it failed, print msg % args if verbose. Returns status. """
+    if status == 0 and not c_hlp.verbose: return status
+
+    c_hlp.ProcessError( msg % args if args else msg, status, eds_err )
+
+    return status
+
+def LoadEDSDK(path=None):
+    """ Load the EDSDK (once) and declare the prototypes of the functions we
+        use. Returns the backend set with UseBackend instead if there is
+        one. """
+    global dll
+    if dll is not None: return dll
+
+    sdk = ctypes.WinDLL( path or dll_path )
+
+    for name, ( restype, argtypes ) in prototypes.iteritems():
+        func = getattr( sdk, name )
+        func.restype  = restype
+        func.argtypes = argtypes
+
+    dll = sdk
+
+    return dll
+
+def UseBackend(backend):
+    """ Use backend (anything with the Eds* functions of prototypes) instead
+        of the EDSDK from now on, or go back to loading the DLL if backend
+        is None. Only affects cameras opened afterwards. Returns the backend
+        that was in use. """
+    global dll
+    previous = dll
+    dll = backend
+
+    return previous
@@ -0,0 +1,791 @@
+#!/usr/bin/env python
+"""
+    Stand-ins for the camera so the rest of the scripts can be run, timed and
+    checked without a Canon body attached (or Windows for that matter).
+
+    FakeCamera stands in for CanonLiveView and SimulatedSDK for the whole
+    EDSDK: hand one to canon_sdk.UseBackend and CanonLiveView runs against
+    it unchanged (see canon_cam.py --sim).
+
+    Run as a script it checks how CanonLiveView copes when the camera
+    misbehaves (see CHECKS).
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import argparse
+import collections
+import ctypes
+import cv2
+import glob
+import numpy as np
+import os
+import threading
+import sys
+import time
+
+import canon_helpers as c_hlp # Our helpers
+import canon_sdk as c_sdk # The EDSDK binding
+from canon_types import eds_typ # EDSDK Types from the types header
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+# The EDSDK errors SimulatedSDK returns
+DEVICE_BUSY            = 0x81
+FILE_OPEN_ERROR        = 0x23
+INVALID_HANDLE         = 0x61
+INVALID_INDEX          = 0x63
+OBJECT_NOTREADY        = 0xA102
+PROPERTIES_UNAVAILABLE = 0x50
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class FakeCamera():
+    """ Serves synthetic live view jpegs at a fixed frame rate through the
+        same GrabFrame/DecodeFrame methods CanonLiveView has, for driving the
+        live view engine headless. """
+
+    def __init__(self, fps=30., height=704, width=1056, n_frames=8):
+        self.fps    = fps
+        self.frames = SyntheticFrames( height, width, n_frames )
+        self.index  = 0
+        self.t_next = 0
+
+    def DecodeFrame(self, jpeg):
+        return cv2.imdecode( np.frombuffer( jpeg, np.uint8 ),
+                             cv2.IMREAD_COLOR )
+
+    def GrabFrame(self):
+        # Pretend to be a camera that only has a new frame every 1/fps s
+        now = time.time()
+        if now < self.t_next:
+            time.sleep( self.t_next - now )
+        self.t_next = max( now, self.t_next ) + 1. / self.fps
+
+        jpeg = self.frames[self.index]
+        self.index = ( self.index + 1 ) % len(self.frames)
+
+        return jpeg
+
+
+class SimItem():
+    """ A file or folder on the simulated card. Folders have a list of
+        children, files their contents in data. """
+
+    def __init__(self, name, data="", folder=False, parent=None):
+        self.children = [] if folder else None
+        self.data     = data
+        self.name     = name
+        self.parent   = parent
+
+        if parent is not None:
+            parent.children.append(self)
+
+    def Child(self, name):
+        """ The child called name, made a folder if there is none. """
+        for child in self.children:
+            if child.name == name: return child
+
+        return SimItem( name, folder=True, parent=self )
+
+
+class SimStream():
+    """ An EDSDK stream: a buffer in memory (which grows when more is written
+        to it than it holds, like the SDK's) or a file on the host. """
+
+    def __init__(self, size=0, path=None):
+        self.buffer = None if path else ( ctypes.c_ubyte * max(size, 1) )()
+        self.length = 0
+        self.path   = path
+
+    def Write(self, data):
+        if self.path:
+            with open( self.path, "wb" ) as f:
+                f.write(data)
+
+        else:
+            if len(data) > len(self.buffer):
+                self.buffer = ( ctypes.c_ubyte * len(data) )()
+            ctypes.memmove( self.buffer, data, len(data) )
+
+        self.length = len(data)
+
+
+class SimulatedSDK():
+    """ The whole EDSDK as far as the scripts use it, with a simulated camera
+        behind it. Install it with canon_sdk.UseBackend(SimulatedSDK(...))
+        before CanonLiveView is created.
+
+        Live view serves frames (a list of jpegs, a directory of them, a
+        function of the frame number or, by default, synthetic ones) at fps
+        frames a second: like the real camera, every EVF download gets
+        whichever frame is current, so downloading faster than fps gets the
+        same frame again. Nothing comes out before Evf_OutputDevice is set
+        to the PC.
+
+        The card holds DCIM/100CANON. Taking a picture adds capture (the
+        contents of a RAW file, or capture_size bytes of nothing) after
+        capture_delay seconds and reports it with the object event of the
+        SaveTo setting. Property writes are confirmed with PropertyChanged
+        after property_delay; Inject queues any other event. Events are only
+        delivered by EdsGetEvent, on the thread that calls it.
+
+        latency maps function names to seconds every call of them takes,
+        bandwidth caps downloads (bytes a second), Fail makes the next
+        calls of a function return an error and Drop loses events. calls
+        counts the calls by function and Outstanding the refs nobody
+        released. """
+
+    def __init__(self, frames=None, fps=30., capture=None,
+                 capture_size=1 << 20, capture_delay=0.3, property_delay=0.05,
+                 latency=None, bandwidth=None):
+        self.bandwidth      = bandwidth
+        self.calls          = collections.Counter()
+        self.capture_delay  = capture_delay
+        self.captures       = 0 # Pictures taken, for the file names
+        self.drops          = collections.Counter() # ( kind, event ) to lose
+        self.errors         = {} # function name : statuses to return next
+        self.fps            = fps
+        self.frames         = Frames(frames)
+        self.handlers       = {}
+        self.handles        = {} # handle : [ kind, object, references ]
+        self.lock           = threading.RLock()
+        self.next_handle    = 0x1000
+        self.pending        = [] # ( due, kind, event, arg )
+        self.property_delay = property_delay
+        self.started        = time.time()
+
+        # A USB round trip per live view frame
+        self.latency = { "EdsDownloadEvfImage" : 0.01 }
+        self.latency.update( latency or {} )
+
+        if capture is None:
+            self.capture = "\0" * capture_size
+        else:
+            with open( capture, "rb" ) as f:
+                self.capture = f.read()
+
+        self.properties = {
+            eds_typ["kEdsPropID_Av"]               : 0x30, # 5.6
+            eds_typ["kEdsPropID_Evf_OutputDevice"] : 0,
+            eds_typ["kEdsPropID_ISOSpeed"]         : 0x48, # 100
+            eds_typ["kEdsPropID_ImageQuality"]     : eds_typ[
+                                                     "EdsImageQuality_LR"],
+            eds_typ["kEdsPropID_SaveTo"]           : eds_typ[
+                                                     "kEdsSaveTo_Camera"],
+            eds_typ["kEdsPropID_Tv"]               : 0x68 } # 1/60
+
+        self.card = SimItem( "card", folder=True )
+        self.card.Child("DCIM").Child("100CANON")
+
+    def AddFile(self, name, data="", folder="100CANON"):
+        """ Put a file on the card in DCIM/folder. """
+        return SimItem( name,
+                        data,
+                        parent=self.card.Child("DCIM").Child(folder) )
+
+    def Begin(self, name):
+        """ Every call starts here: count it, take its time and return the
+            error it was told to fail with, if any. """
+        self.calls[name] += 1
+
+        delay = self.latency.get(name)
+        if delay: time.sleep(delay)
+
+        errors = self.errors.get(name)
+        if errors: return errors.pop(0)
+
+        return 0
+
+    def Capture(self):
+        """ Take a picture: the new file shows up capture_delay later. """
+        self.captures += 1
+        name = "IMG_%04d.CR2" % self.captures
+
+        if self.properties[ eds_typ["kEdsPropID_SaveTo"] ] == \
+           eds_typ["kEdsSaveTo_Host"]:
+            # Straight to the host; it never makes it to the card
+            item  = SimItem( name, self.capture )
+            event = eds_typ["kEdsObjectEvent_DirItemRequestTransfer"]
+        else:
+            item  = self.AddFile( name, self.capture )
+            event = eds_typ["kEdsObjectEvent_DirItemCreated"]
+
+        self.Queue( self.capture_delay, "object", event, item )
+
+    def EdsCloseSession(self, camera):
+        status = self.Begin("EdsCloseSession")
+        if status: return status
+
+        return 0 if self.Lookup( camera, "camera" ) else INVALID_HANDLE
+
+    def EdsCreateEvfImageRef(self, stream, out):
+        status = self.Begin("EdsCreateEvfImageRef")
+        if status: return status
+
+        stream = self.Lookup( stream, "stream" )
+        if stream is None: return INVALID_HANDLE
+
+        Store( out, self.New( "evf", stream ) )
+        return 0
+
+    def EdsCreateFileStream(self, path, disposition, access, out):
+        status = self.Begin("EdsCreateFileStream")
+        if status: return status
+
+        try:
+            open( path, "wb" ).close()
+        except IOError:
+            return FILE_OPEN_ERROR
+
+        Store( out, self.New( "stream", SimStream( path=path ) ) )
+        return 0
+
+    def EdsCreateMemoryStream(self, size, out):
+        status = self.Begin("EdsCreateMemoryStream")
+        if status: return status
+
+        Store( out, self.New( "stream", SimStream( Value(size) ) ) )
+        return 0
+
+    def EdsDeleteDirectoryItem(self, item):
+        status = self.Begin("EdsDeleteDirectoryItem")
+        if status: return status
+
+        item = self.Lookup( item, "item" )
+        if item is None: return INVALID_HANDLE
+
+        if item.parent is not None:
+            item.parent.children.remove(item)
+            item.parent = None
+
+        return 0
+
+    def EdsDownload(self, item, size, stream):
+        status = self.Begin("EdsDownload")
+        if status: return status
+
+        item   = self.Lookup( item, "item" )
+        stream = self.Lookup( stream, "stream" )
+        if item is None or stream is None: return INVALID_HANDLE
+
+        data = item.data[:Value(size)]
+        if self.bandwidth:
+            time.sleep( len(data) / float(self.bandwidth) )
+
+        try:
+            stream.Write(data)
+        except IOError:
+            return FILE_OPEN_ERROR
+
+        return 0
+
+    def EdsDownloadComplete(self, item):
+        status = self.Begin("EdsDownloadComplete")
+        if status: return status
+
+        return 0 if self.Lookup( item, "item" ) else INVALID_HANDLE
+
+    def EdsDownloadEvfImage(self, camera, evf):
+        status = self.Begin("EdsDownloadEvfImage")
+        if status: return status
+
+        stream = self.Lookup( evf, "evf" )
+        if stream is None: return INVALID_HANDLE
+
+        if not self.properties[ eds_typ["kEdsPropID_Evf_OutputDevice"] ] & \
+               eds_typ["kEdsEvfOutputDevice_PC"]:
+            return OBJECT_NOTREADY
+
+        stream.Write( self.Frame() )
+        return 0
+
+    def EdsGetCameraList(self, out):
+        status = self.Begin("EdsGetCameraList")
+        if status: return status
+
+        Store( out, self.New( "list", self ) )
+        return 0
+
+    def EdsGetChildAtIndex(self, ref, index, out):
+        status = self.Begin("EdsGetChildAtIndex")
+        if status: return status
+
+        entry = self.handles.get( Handle(ref) )
+        if entry is None: return INVALID_HANDLE
+
+        kind, obj = entry[:2]
+        if index < 0 or index >= self.Children( kind, obj ):
+            return INVALID_INDEX
+
+        if kind == "list":     child = ( "camera", self )
+        elif kind == "camera": child = ( "item", self.card )
+        else:                  child = ( "item", obj.children[index] )
+
+        Store( out, self.New(*child) )
+        return 0
+
+    def EdsGetChildCount(self, ref, out):
+        status = self.Begin("EdsGetChildCount")
+        if status: return status
+
+        entry = self.handles.get( Handle(ref) )
+        if entry is None: return INVALID_HANDLE
+
+        Store( out, self.Children( *entry[:2] ) )
+        return 0
+
+    def EdsGetDirectoryItemInfo(self, item, out):
+        status = self.Begin("EdsGetDirectoryItemInfo")
+        if status: return status
+
+        item = self.Lookup( item, "item" )
+        if item is None: return INVALID_HANDLE
+
+        info = out._obj
+        info.size       = len(item.data)
+        info.isFolder   = int( item.children is not None )
+        info.szFileName = item.name
+        return 0
+
+    def EdsGetEvent(self):
+        self.Begin("EdsGetEvent")
+
+        now = time.time()
+        with self.lock:
+            due = [ p for p in self.pending if p[0] <= now ]
+            self.pending = [ p for p in self.pending if p[0] > now ]
+
+        for _, kind, event, arg in sorted(due):
+            handler = self.handlers.get(kind)
+            if not handler: continue
+
+            if self.drops[ ( kind, event ) ] > 0:
+                self.drops[ ( kind, event ) ] -= 1
+                continue
+
+            if kind == "object":
+                # The receiver owns the ref it is handed
+                handler( event, self.New( "item", arg ), None )
+            elif kind == "property":
+                handler( event, arg[0], arg[1], None )
+            else:
+                handler( event, arg, None )
+
+        return 0
+
+    def EdsGetLength(self, stream, out):
+        status = self.Begin("EdsGetLength")
+        if status: return status
+
+        stream = self.Lookup( stream, "stream" )
+        if stream is None: return INVALID_HANDLE
+
+        Store( out, stream.length )
+        return 0
+
+    def EdsGetPointer(self, stream, out):
+        status = self.Begin("EdsGetPointer")
+        if status: return status
+
+        stream = self.Lookup( stream, "stream" )
+        if stream is None or stream.buffer is None: return INVALID_HANDLE
+
+        Store( out, ctypes.addressof(stream.buffer) )
+        return 0
+
+    def EdsGetPropertyData(self, camera, prop_id, param, size, out):
+        status = self.Begin("EdsGetPropertyData")
+        if status: return status
+
+        if prop_id not in self.properties: return PROPERTIES_UNAVAILABLE
+
+        Store( out, self.properties[prop_id] )
+        return 0
+
+    def EdsInitializeSDK(self):
+        return self.Begin("EdsInitializeSDK")
+
+    def EdsOpenSession(self, camera):
+        status = self.Begin("EdsOpenSession")
+        if status: return status
+
+        return 0 if self.Lookup( camera, "camera" ) else INVALID_HANDLE
+
+    def EdsRelease(self, ref):
+        self.Begin("EdsRelease")
+
+        with self.lock:
+            entry = self.handles.get( Handle(ref) )
+            if entry is None: return 0xFFFFFFFF
+
+            entry[2] -= 1
+            if entry[2] == 0:
+                del self.handles[ Handle(ref) ]
+
+            return entry[2]
+
+    def EdsRetain(self, ref):
+        self.Begin("EdsRetain")
+
+        with self.lock:
+            entry = self.handles.get( Handle(ref) )
+            if entry is None: return 0xFFFFFFFF
+
+            entry[2] += 1
+            return entry[2]
+
+    def EdsSendCommand(self, camera, command, param):
+        status = self.Begin("EdsSendCommand")
+        if status: return status
+
+        if command == eds_typ["kEdsCameraCommand_TakePicture"]:
+            self.Capture()
+
+        return 0
+
+    def EdsSetCameraStateEventHandler(self, camera, event, handler, context):
+        self.handlers["state"] = handler
+        return self.Begin("EdsSetCameraStateEventHandler")
+
+    def EdsSetCapacity(self, camera, capacity):
+        return self.Begin("EdsSetCapacity")
+
+    def EdsSetObjectEventHandler(self, camera, event, handler, context):
+        self.handlers["object"] = handler
+        return self.Begin("EdsSetObjectEventHandler")
+
+    def EdsSetPropertyData(self, camera, prop_id, param, size, value):
+        status = self.Begin("EdsSetPropertyData")
+        if status: return status
+
+        if prop_id not in self.properties: return PROPERTIES_UNAVAILABLE
+
+        self.properties[prop_id] = value._obj.value
+        self.Queue( self.property_delay,
+                    "property",
+                    eds_typ["kEdsPropertyEvent_PropertyChanged"],
+                    ( prop_id, 0 ) )
+        return 0
+
+    def EdsSetPropertyEventHandler(self, camera, event, handler, context):
+        self.handlers["property"] = handler
+        return self.Begin("EdsSetPropertyEventHandler")
+
+    def EdsTerminateSDK(self):
+        return self.Begin("EdsTerminateSDK")
+
+    def Children(self, kind, obj):
+        """ How many children the object behind a ref has. """
+        if kind in ( "list", "camera" ): return 1
+        if kind == "item" and obj.children is not None:
+            return len(obj.children)
+
+        return 0
+
+    def Drop(self, kind, event, times=1):
+        """ Lose the next times events of kind instead of delivering them,
+            like a camera that never reports a capture. """
+        self.drops[ ( kind, event ) ] += times
+
+    def Fail(self, name, status=DEVICE_BUSY, times=1):
+        """ Make the next times calls of the EDSDK function name return
+            status (and do nothing else). """
+        self.errors.setdefault( name, [] ).extend( [status] * times )
+
+    def Frame(self):
+        """ The live view frame of the moment. """
+        index = int( ( time.time() - self.started ) * self.fps )
+
+        if callable(self.frames): return self.frames(index)
+
+        return self.frames[ index % len(self.frames) ]
+
+    def Inject(self, kind, event, arg=0, delay=0.):
+        """ Queue an event, e.g. Inject("state", kEdsStateEvent_Shutdown).
+            kind is "object", "state" or "property" and arg is a SimItem,
+            the state parameter or a (property id, param) pair
+            respectively. """
+        self.Queue( delay, kind, event, arg )
+
+    def Lookup(self, ref, kind):
+        """ The object behind a ref of the given kind, or None if it isn't
+            one. """
+        entry = self.handles.get( Handle(ref) )
+        if entry is None or entry[0] != kind: return None
+
+        return entry[1]
+
+    def New(self, kind, obj):
+        """ Hand out a new ref to obj. """
+        with self.lock:
+            handle = self.next_handle
+            self.next_handle += 0x10
+
+            self.handles[handle] = [ kind, obj, 1 ]
+
+        return handle
+
+    def Outstanding(self):
+        """ The refs handed out and not released yet, as (handle, kind). """
+        return sorted( ( handle, entry[0] )
+                       for handle, entry in self.handles.items() )
+
+    def Queue(self, delay, kind, event, arg):
+        with self.lock:
+            self.pending.append( ( time.time() + delay, kind, event, arg ) )
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def ArgParser():
+    """ This function will handle the input arguments while keeping the main
+        function tidy. """
+
+    usage = """
+    canon_sim.py [-v] [CHECK ...]
+
+    Run CanonLiveView against the simulated camera, making it misbehave,
+    and check that it copes. With no CHECK given every check is run.
+
+            """
+
+    parser = argparse.ArgumentParser( description = "Simulated camera",
+                                      usage = usage)
+
+    parser.add_argument( "checks",
+                         nargs   = '*',
+                         action  = "store",
+                         default = [],
+                         help    = "The check(s) to run: %s" % \
+                                   ", ".join(sorted(CHECKS)) )
+
+    parser.add_argument( "-v",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "verbose",
+                         help    = "Make this script a chatterbox." )
+
+    args = parser.parse_args()
+
+    for name in args.checks:
+        if name not in CHECKS:
+            parser.error( "Unknown check %s" % name )
+
+    c_hlp.verbose = args.verbose
+
+    return args.checks or sorted(CHECKS)
+
+def Check_CaptureFallback():
+    """ Saving to the card, a capture whose object event never arrives is
+        still downloaded: Take_Picture gives up without exiting and
+        DownloadImage finds the file on the card instead. """
+    sim = SimulatedSDK( capture_delay=0., capture_size=1024 )
+    sim.Drop( "object", eds_typ["kEdsObjectEvent_DirItemCreated"] )
+
+    camera = OpenCamera( sim,
+                         save_to   = "card",
+                         in_memory = True,
+                         archive   = False )
+    try:
+        capture = camera.Take_RAW_Monochrome( timeout=0.5 )
+    finally:
+        camera.Cleanup()
+        c_sdk.UseBackend(None)
+
+    assert capture is not None, "Nothing was downloaded"
+    assert capture[0].endswith("IMG_0001.CR2"), capture[0]
+    assert len(capture[1]) == 1024, "Got %i bytes" % len(capture[1])
+    assert not sim.card.Child("DCIM").Child("100CANON").children, \
+           "The capture was left on the card"
+    assert not sim.Outstanding(), "Refs left: %s" % sim.Outstanding()
+
+def Check_CorruptFrame():
+    """ A live view frame that doesn't decode is skipped; the frames after
+        it still make it to the UI. """
+    from canon_liveview import LiveViewEngine
+
+    good = SyntheticFrames( n_frames=2 )
+    sim = SimulatedSDK( frames = [ good[0], "not a jpeg", good[1] ],
+                        fps    = 20. )
+
+    camera = OpenCamera(sim)
+    engine = LiveViewEngine(camera)
+    engine.Start()
+    try:
+        shown = 0
+        t_end = time.time() + 1.
+        while time.time() < t_end:
+            if engine.Frame() is not None: shown += 1
+    finally:
+        engine.Stop()
+        camera.Cleanup()
+        c_sdk.UseBackend(None)
+
+    assert engine.n_corrupt > 0, "The corrupt frame was never grabbed"
+    assert shown > engine.n_corrupt, "Only %i frames shown" % shown
+
+def Check_EngineError():
+    """ An EDSDK error on the producer thread stops the live view and is
+        raised on the UI thread instead of freezing the preview. """
+    from canon_liveview import LiveViewEngine
+
+    sim = SimulatedSDK()
+
+    camera = OpenCamera(sim)
+    engine = LiveViewEngine(camera)
+    engine.Start()
+
+    raised = None
+    try:
+        sim.Fail("EdsCreateEvfImageRef")
+
+        t_end = time.time() + 2.
+        while time.time() < t_end:
+            engine.Frame()
+    except SystemExit as e:
+        raised = e
+    finally:
+        engine.Stop()
+        camera.Cleanup()
+        c_sdk.UseBackend(None)
+
+    assert raised is not None, "The error never reached the UI thread"
+    assert not engine.threads, "The engine is still running"
+
+def Check_SettingWrites():
+    """ A setting the camera never confirms stops showing as pending after
+        the writer's timeout, and a write the camera refuses doesn't stop
+        the ones after it. """
+    import canon_cam
+
+    iso = eds_typ["kEdsPropID_ISOSpeed"]
+    sim = SimulatedSDK( property_delay=0. )
+
+    camera = OpenCamera(sim)
+    writer = camera.writer
+    try:
+        # Never confirmed
+        sim.Drop( "property", eds_typ["kEdsPropertyEvent_PropertyChanged"] )
+        camera.StepSetting( iso, canon_cam.iso, +1 )
+        time.sleep( writer.timeout + 0.2 )
+        stale = writer.Pending(iso)
+
+        # Refused, then a good one
+        sim.Fail("EdsSetPropertyData")
+        camera.UpdateSetting( iso, 0x50 )
+        time.sleep(0.2)
+        camera.UpdateSetting( iso, 0x58 )
+        time.sleep(0.2)
+        value = sim.properties[iso]
+    finally:
+        camera.Cleanup()
+        c_sdk.UseBackend(None)
+
+    assert stale is None, "Still pending: 0x%X" % stale
+    assert writer.failed == 1, "%i writes failed" % writer.failed
+    assert value == 0x58, "ISO is 0x%X" % value
+
+def Frames(source):
+    """ The live view frames SimulatedSDK serves: None for synthetic ones,
+        the path of a directory of jpegs, a list of jpegs (as strings) or a
+        function returning the jpeg of a frame number. """
+    if source is None:
+        return SyntheticFrames()
+
+    if callable(source):
+        return source
+
+    if isinstance( source, basestring ):
+        paths = sorted( path for path in glob.glob( os.path.join( source,
+                                                                 "*" ) )
+                        if os.path.splitext(path)[1].lower() in ( ".jpg",
+                                                                  ".jpeg" ) )
+        if not paths:
+            raise IOError( "No jpegs in %s" % source )
+
+        frames = []
+        for path in paths:
+            with open( path, "rb" ) as f:
+                frames.append( f.read() )
+
+        return frames
+
+    return list(source)
+
+def OpenCamera(sim, **kwargs):
+    """ A CanonLiveView (made with kwargs) running against sim, with live
+        view already on the PC so it doesn't wait for the mirror. Call
+        Cleanup and UseBackend(None) when done. """
+    import canon_cam # It imports us
+
+    sim.properties[ eds_typ["kEdsPropID_Evf_OutputDevice"] ] = \
+        eds_typ["kEdsEvfOutputDevice_PC"]
+    c_sdk.UseBackend(sim)
+
+    return canon_cam.CanonLiveView( **kwargs )
+
+def Handle(ref):
+    """ The handle behind a ref, whatever it was passed as (EdsRef, c_void_p
+        or int). """
+    ref = getattr( ref, "_as_parameter_", ref )
+
+    return getattr( ref, "value", ref )
+
+def Store(out, value):
+    """ Write value to where a byref() out parameter points. """
+    out._obj.value = value
+
+def SyntheticFrames(height=704, width=1056, n_frames=8):
+    """ Pre-encode a handful of jpegs with a bar moving across them so
+        consecutive frames are actually different. """
+    frames = []
+
+    base = np.random.randint( 0, 256, (height, width, 3) ).astype(np.uint8)
+    base = cv2.GaussianBlur( base, (9,9), 0 )
+    for i in range(n_frames):
+        image = base.copy()
+        x = i * width // n_frames
+        cv2.rectangle( image, (x,0), (x+20,height), (255,255,255), -1 )
+
+        _, jpeg = cv2.imencode( ".jpg", image )
+        frames.append( jpeg.tostring() )
+
+    return frames
+
+def Value(number):
+    """ The value of a number passed as a ctypes object or as is. """
+    return getattr( number, "value", number )
+
+CHECKS = { "capture_fallback" : Check_CaptureFallback,
+           "corrupt_frame"    : Check_CorruptFrame,
+           "engine_error"     : Check_EngineError,
+           "setting_writes"   : Check_SettingWrites }
+
+if __name__ == "__main__":
+    checks = ArgParser()
+
+    failed = []
+    for name in checks:
+        try:
+            CHECKS[name]()
+        except AssertionError as e:
+            print "%-20s FAILED: %s" % ( name, e )
+            failed.append(name)
+        else:
+            print "%-20s ok" % name
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+    Cached camera properties. Every EdsGetPropertyData is a USB round trip,
+    so CameraState reads the properties we care about once, re-reads one only
+    when the camera says it changed (kEdsPropertyEvent_PropertyChanged) and
+    answers everything else from memory. Writes of a value the camera
+    already has are skipped.
+
+    SettingsWriter makes the writes on a thread of its own, merging changes
+    of the same setting that pile up while it waits for the camera.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import collections
+import ctypes
+import sys
+import threading
+import time
+
+from canon_types import eds_typ # EDSDK Types from the types header
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class CameraState():
+    """ The current values of a set of (unsigned int) camera properties,
+        kept up to date by the property events CameraEvents passes on. The
+        events only arrive while somebody pumps them (CanonLiveView does on
+        every live view frame), which is also the thread the re-reads happen
+        on. """
+
+    def __init__(self, dll, camera, events, properties, error=None):
+        self.camera    = camera
+        self.dll       = dll
+        self.error     = error
+        self.listeners = [] # Called with (property id, value) after a read
+        self.reads     = 0 # Round trips to the camera, for the curious
+        self.skipped   = 0 # Writes that weren't needed
+        self.values    = {}
+        self.writes    = 0
+
+        for prop_id in properties:
+            self.Read(prop_id)
+
+        events.AddPropertyListener(self.PropertyEvent)
+
+    def AddListener(self, listener):
+        self.listeners.append(listener)
+
+    def Error(self, msg, status, *args):
+        if self.error is not None:
+            self.error( msg, status, *args )
+
+    def Get(self, prop_id):
+        """ The value of a property, from memory. """
+        return self.values[prop_id]
+
+    def Label(self, prop_id, table):
+        """ The label of a property's value in table (a PropertyTable), or the
+            raw code if the table doesn't know it. """
+        code = self.values[prop_id]
+        index = table.by_code.get(code)
+
+        return "0x%X" % code if index is None else table.Label(index)
+
+    def PropertyEvent(self, event, prop_id, param):
+        if event == eds_typ["kEdsPropertyEvent_PropertyChanged"] and \
+           prop_id in self.values:
+            self.Read(prop_id)
+
+    def Read(self, prop_id):
+        """ Read a property from the camera (a round trip) into the cache. """
+        value = ctypes.c_uint(0)
+        status = self.dll.EdsGetPropertyData( self.camera,
+                                              prop_id,
+                                              0,
+                                              ctypes.sizeof(value),
+                                              ctypes.byref(value) )
+        self.Error( "Get property 0x%X", status, prop_id )
+        self.reads += 1
+
+        self.values[prop_id] = value.value
+
+        for listener in self.listeners:
+            listener( prop_id, value.value )
+
+        return value.value
+
+    def Set(self, prop_id, value):
+        """ Set a property unless it already has value. Returns whether the
+            camera was written to. """
+        if self.values.get(prop_id) == value:
+            self.skipped += 1
+            return False
+
+        prop = ctypes.c_uint(value)
+        status = self.dll.EdsSetPropertyData( self.camera,
+                                              prop_id,
+                                              0,
+                                              ctypes.sizeof(prop),
+                                              ctypes.byref(prop) )
+        self.Error( "Set property 0x%X", status, prop_id )
+        self.writes += 1
+
+        # values only ever holds what the camera reported; it confirms with a
+        # PropertyChanged event, which re-reads the property
+        return True
+
+
+class SettingsWriter():
+    """ Apply setting changes on a background thread. Request only queues a
+        change; a newer request for a setting that is still queued replaces
+        it (in its new place in the order), so a held down key ends up as a
+        single write of the final value. Writes are made one at a time in
+        the order requested, holding lock. A write counts as done when the
+        camera reports the property again (see CameraState); on_ack is then
+        called with (property id, value asked for, value the camera has,
+        seconds since the write). The next write of the same setting waits
+        for that (or timeout seconds), so requests keep merging meanwhile.
+        A write that is never confirmed is forgotten after timeout, and one
+        that fails is reported and dropped (counted in failed); either way
+        the thread keeps going.
+    """
+
+    def __init__(self, state, lock, on_ack=None, timeout=1.):
+        self.coalesced = 0 # Requests replaced before they were written
+        self.cond      = threading.Condition()
+        self.failed    = 0 # Writes the camera refused
+        self.lock      = lock
+        self.on_ack    = on_ack
+        self.queued    = collections.OrderedDict() # property id : value
+        self.running   = True
+        self.sent      = {} # property id : ( value, time written )
+        self.state     = state
+        self.timeout   = timeout
+
+        state.AddListener(self.Changed)
+
+        self.thread = threading.Thread( target=self.Run,
+                                        name="settings writer" )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Changed(self, prop_id, value):
+        with self.cond:
+            sent = self.sent.pop( prop_id, None )
+
+            self.cond.notify()
+
+        if sent is not None and self.on_ack is not None:
+            self.on_ack( prop_id, sent[0], value, time.time() - sent[1] )
+
+    def Close(self):
+        """ Write whatever is still queued, then stop. """
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+        self.thread.join()
+
+    def Expire(self):
+        """ Forget the writes the camera hasn't confirmed within timeout.
+            Call with cond held. """
+        now = time.time()
+        for prop_id, ( _, t_sent ) in self.sent.items():
+            if now - t_sent > self.timeout:
+                del self.sent[prop_id]
+
+    def Next(self):
+        """ Take the oldest queued change of a setting that isn't waiting for
+            the camera to confirm an earlier write, or return None if there
+            is none. Call with cond held. """
+        self.Expire()
+
+        for prop_id in self.queued:
+            if prop_id not in self.sent:
+                return prop_id, self.queued.pop(prop_id)
+
+        return None
+
+    def Pending(self, prop_id):
+        """ The value a setting is being changed to, or None if the camera
+            has confirmed everything asked of it. """
+        with self.cond:
+            if prop_id in self.queued:
+                return self.queued[prop_id]
+
+            self.Expire()
+            if prop_id in self.sent:
+                return self.sent[prop_id][0]
+
+        return None
+
+    def Request(self, prop_id, value):
+        with self.cond:
+            if prop_id in self.queued:
+                del self.queued[prop_id]
+                self.coalesced += 1
+
+            self.queued[prop_id] = value
+            self.cond.notify()
+
+    def Run(self):
+        # The EDSDK is COM based on Windows; every thread that talks to it has
+        # to initialize COM first
+        if sys.platform == "win32":
+            ctypes.windll.ole32.CoInitializeEx(None, 0)
+
+        while True:
+            with self.cond:
+                item = self.Next()
+                while item is None and ( self.running or self.queued ):
+                    self.cond.wait( 0.05 if self.queued else None )
+                    item = self.Next()
+
+                if item is None: break
+
+                prop_id, value = item
+
+            # Events are only pumped with lock held, so any PropertyChanged
+            # seen after this point answers this write
+            with self.lock:
+                with self.cond:
+                    self.sent[prop_id] = ( value, time.time() )
+
+                try:
+                    written = self.state.Set( prop_id, value )
+
+                except ( Exception, SystemExit ) as e:
+                    # The error handler exits on a failed call (having
+                    # printed why); here that would only end this thread and
+                    # every later change with it
+                    why = "" if isinstance( e, SystemExit ) else " (%s)" % e
+                    print "Setting property 0x%X to 0x%X failed%s, leaving " \
+                          "it as it is" % ( prop_id, value, why )
+                    self.failed += 1
+                    written = False
+
+                if not written:
+                    # The camera already had it, or won't take it
+                    with self.cond:
+                        self.sent.pop( prop_id, None )
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+    Where the time goes, stage by stage. Instrument wraps a function or
+    method so every call is timed into a latency histogram for its stage;
+    Count and Set keep counters (bytes downloaded, captures) and gauges
+    (frame counts). Dump writes it all as JSON (with p50/p95/p99 per stage)
+    or in the Prometheus text format.
+
+    Nothing is wrapped until Instrument is called, so with instrumentation
+    off the stages run exactly as they always did. A timed call costs two
+    clock reads, a bisect and a lock.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import bisect
+import functools
+import json
+import sys
+import threading
+import timeit
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+# Upper bounds of the histogram buckets: 10 us to 100 s, 8 per decade
+bounds = [ 1e-5 * 10 ** ( i / 8. ) for i in range(57) ]
+
+clock      = timeit.default_timer # The best wall clock on the platform
+counters   = {} # name : count, only ever goes up
+gauges     = {} # name : value at the time it was set
+histograms = {} # stage : Histogram
+lock       = threading.Lock() # Around counters and gauges
+patched    = [] # ( owner, attribute, original ) of everything instrumented
+prefix     = "canon" # Of the Prometheus metric names
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class Histogram():
+    """ Latencies of one stage in log spaced buckets (see bounds), so
+        recording one is cheap and the memory is fixed however many calls
+        there are. Percentiles are interpolated within a bucket, which is
+        good to a few percent. """
+
+    def __init__(self, name):
+        self.count  = 0
+        self.counts = [0] * ( len(bounds) + 1 ) # The last one is overflow
+        self.lock   = threading.Lock()
+        self.max    = 0.
+        self.min    = None
+        self.name   = name
+        self.total  = 0.
+
+    def Percentile(self, q):
+        """ The latency a fraction q (0 to 1) of the calls stayed under. """
+        if self.count == 0: return None
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low  = bounds[i - 1] if i > 0 else 0.
+                high = bounds[i] if i < len(bounds) else self.max
+                value = low + ( high - low ) * ( rank - seen ) / n
+
+                return min( max( value, self.min ), self.max )
+
+            seen += n
+
+        return self.max
+
+    def Record(self, seconds):
+        i = bisect.bisect_left( bounds, seconds )
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max: self.max = seconds
+            if self.min is None or seconds < self.min: self.min = seconds
+
+    def Summary(self):
+        return { "count" : self.count,
+                 "mean"  : self.total / self.count if self.count else None,
+                 "min"   : self.min,
+                 "max"   : self.max,
+                 "p50"   : self.Percentile(0.5),
+                 "p95"   : self.Percentile(0.95),
+                 "p99"   : self.Percentile(0.99) }
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def Count(name, n=1):
+    """ Add n to a counter. """
+    with lock:
+        counters[name] = counters.get( name, 0 ) + n
+
+def Dump(file_path="-"):
+    """ Write everything recorded so far to file_path: JSON if it ends in
+        .json, the Prometheus text format otherwise, stdout for -. """
+    text = ToJSON() if file_path.endswith(".json") else ToPrometheus()
+
+    if file_path == "-":
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    else:
+        with open( file_path, "w" ) as f:
+            f.write(text)
+
+def GetHistogram(stage):
+    """ The histogram of a stage, made if there isn't one yet. """
+    with lock:
+        if stage not in histograms:
+            histograms[stage] = Histogram(stage)
+
+        return histograms[stage]
+
+def Instrument(owner, name, stage=None, count=None):
+    """ Time every call of the function (or method) name of owner (a module
+        or a class) into the histogram of stage (name by default). count,
+        if given, is called with the result of every call, to keep
+        counters. Instrumenting something twice does nothing. """
+    func = vars(owner)[name]
+    if getattr( func, "instrumented", False ): return
+
+    histogram = GetHistogram( stage or name )
+
+    @functools.wraps(func)
+    def Timed(*args, **kwargs):
+        t0 = clock()
+        try:
+            result = func( *args, **kwargs )
+        finally:
+            histogram.Record( clock() - t0 )
+
+        if count is not None: count(result)
+
+        return result
+
+    Timed.instrumented = True
+
+    setattr( owner, name, Timed )
+    patched.append( ( owner, name, func ) )
+
+def Record(stage, seconds):
+    """ Add a latency measured some other way to a stage. """
+    GetHistogram(stage).Record(seconds)
+
+def Restore():
+    """ Put back everything Instrument wrapped. What was recorded stays. """
+    while patched:
+        owner, name, func = patched.pop()
+        setattr( owner, name, func )
+
+def Set(name, value):
+    """ Set a gauge. """
+    with lock:
+        gauges[name] = value
+
+def Snapshot():
+    """ Everything recorded so far as a dict, latencies in seconds. """
+    with lock:
+        stages = dict( ( stage, histogram.Summary() )
+                       for stage, histogram in histograms.iteritems() )
+
+        return { "stages"   : stages,
+                 "counters" : dict(counters),
+                 "gauges"   : dict(gauges) }
+
+def ToJSON():
+    return json.dumps( Snapshot(), indent=1, sort_keys=True ) + "\n"
+
+def ToPrometheus():
+    """ Everything recorded so far in the Prometheus text format: one
+        histogram metric labeled by stage, a counter or gauge per name. """
+    name  = "%s_stage_seconds" % prefix
+    lines = [ "# HELP %s Time spent in each stage." % name,
+              "# TYPE %s histogram" % name ]
+
+    with lock:
+        for stage, histogram in sorted( histograms.iteritems() ):
+            with histogram.lock:
+                cumulative = 0
+                for bound, n in zip( bounds + [ "+Inf" ], histogram.counts ):
+                    cumulative += n
+                    le = bound if bound == "+Inf" else "%.6g" % bound
+                    lines.append( '%s_bucket{stage="%s",le="%s"} %i' % (
+                                  name, stage, le, cumulative ) )
+
+                lines.append( '%s_sum{stage="%s"} %.9g' % ( name,
+                                                           stage,
+                                                           histogram.total ) )
+                lines.append( '%s_count{stage="%s"} %i' % ( name,
+                                                           stage,
+                                                           histogram.count ) )
+
+        for kind, values, suffix in ( ( "counter", counters, "_total" ),
+                                      ( "gauge", gauges, "" ) ):
+            for key, value in sorted( values.iteritems() ):
+                metric = "%s_%s%s" % ( prefix, key, suffix )
+                lines.append( "# TYPE %s %s" % ( metric, kind ) )
+                lines.append( "%s %.9g" % ( metric, value ) )
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+    Headless batch mode for the processing side: run every RAW capture in a
+    set of directories or globs through decode, normalize, deskew (and
+    optionally unwrap) and OCR, and write one JSON line per file as results
+    come in.
+
+    Files are spread over a pool of worker processes. Only the file path goes
+    to a worker and only the small result record comes back; the whole chain
+    runs inside the worker so no image is ever pickled between processes.
+    Each worker keeps one Tesseract engine (see prep_ocr) and runs OpenCV
+    single threaded, one core per worker, so throughput scales with the
+    number of workers instead of them fighting over OpenCV's thread pool.
+
+    With --cache every stage result is kept in a prep_cache.StageCache, so a
+    re-run with, say, different OCR settings only redoes the OCR.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import argparse
+import cv2
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import prep_cache
+import prep_geometry
+import prep_image
+import prep_ocr
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+cache      = None # prep_cache.StageCache when caching
+extensions = ( ".cr2", ".cr3", ".dng", ".nef", ".arw" )
+options    = None # Settings of this (worker) process, see WorkerInit
+trim_every = 100  # Results between trims of the cache
+verbose    = False
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def ArgParser():
+    """ This function will handle the input arguments while keeping the main
+        function tidy. """
+
+    usage = """
+    prep_batch.py [-j N] [-o FILE] [--cache DIR] [--unwrap] [--no-ocr]
+                  DIR|GLOB ...
+
+    Process every RAW capture found in the given directories (or matching
+    the given globs) in parallel and write the results as JSON lines.
+
+            """
+
+    parser = argparse.ArgumentParser( description = "Batch RAW processing",
+                                      usage = usage)
+
+    parser.add_argument( "inputs",
+                         nargs   = '+',
+                         action  = "store",
+                         help    = "Directories or globs of RAW files." )
+
+    parser.add_argument( "--cache",
+                         action  = "store",
+                         default = None,
+                         dest    = "cache",
+                         help    = "Keep stage results in this directory " \
+                                   "and reuse them." )
+
+    parser.add_argument( "--cache-size",
+                         action  = "store",
+                         default = 10240,
+                         dest    = "cache_size",
+                         type    = float,
+                         help    = "Cap on the cache in MB (default " \
+                                   "%(default)s)." )
+
+    parser.add_argument( "-j",
+                         action  = "store",
+                         default = None,
+                         dest    = "workers",
+                         type    = int,
+                         help    = "Number of workers (default one per " \
+                                   "core)." )
+
+    parser.add_argument( "-l",
+                         action  = "store",
+                         default = prep_ocr.lang,
+                         dest    = "lang",
+                         help    = "Tesseract language." )
+
+    parser.add_argument( "--no-ocr",
+                         action  = "store_const",
+                         const   = False,
+                         default = True,
+                         dest    = "ocr",
+                         help    = "Stop after the geometry stage." )
+
+    parser.add_argument( "-o",
+                         action  = "store",
+                         default = "results.jsonl",
+                         dest    = "output",
+                         help    = "Where to write the results (- for " \
+                                   "stdout)." )
+
+    parser.add_argument( "--psm",
+                         action  = "store",
+                         default = prep_ocr.psm,
+                         dest    = "psm",
+                         type    = int,
+                         help    = "Tesseract page segmentation mode." )
+
+    parser.add_argument( "--unwrap",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "unwrap",
+                         help    = "Unwrap the label into a strip before " \
+                                   "OCR." )
+
+    parser.add_argument( "-v",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "verbose",
+                         help    = "Make this script a chatterbox." )
+
+    args = parser.parse_args()
+
+    global verbose
+    verbose = args.verbose
+
+    return args
+
+def FindFiles(inputs):
+    """ Expand directories (not recursively) and globs into a sorted list of
+        RAW files, each listed once. """
+    found = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = [ os.path.join( pattern, name )
+                      for name in os.listdir(pattern) ]
+        else:
+            paths = glob.glob(pattern)
+
+        found.update( path.replace('\\','/') for path in paths
+                      if os.path.splitext(path)[1].lower() in extensions )
+
+    return sorted(found)
+
+def Params(args):
+    """ The parameters of each stage, as far as they change its output.
+        ProcessFile passes these to the stages, so the cache keys always
+        match what was computed. """
+    return { "normalize" : { "new_max" : 255, "clip" : None },
+             "skew"      : { "levels" : 2, "band" : 2. },
+             "unwrap"    : { "inner" : 0.3, "bucket" : prep_geometry.bucket },
+             "ocr"       : { "psm" : args.psm, "lang" : args.lang } }
+
+def ProcessFile(file_path):
+    """ Run one file through the whole chain. Returns the result record:
+        the skew found, the OCR text, how long each stage took (its own work,
+        not the stages it waited on), which stages came from the cache and
+        the error if one stopped it. """
+    record = { "file" : file_path, "times" : {}, "cached" : [] }
+    params = Params(options)
+    keys   = {}
+    nested = [0.] # Time spent in the stages a stage asked for
+    values = {}
+
+    def Decode():
+        image = prep_image.DecodeRAW(file_path)
+        if image is None:
+            raise IOError( "Couldn't decode %s" % file_path )
+
+        return image
+
+    def Timed(name, compute):
+        """ Run compute and record how long it took in times[name], less
+            the stages it asked for on the way (they record their own). """
+        outer, nested[0] = nested[0], 0.
+
+        t0 = time.time()
+        try:
+            return compute()
+
+        finally:
+            elapsed = time.time() - t0
+            record["times"][name] = elapsed - nested[0]
+            nested[0] = outer + elapsed
+
+    def OCR():
+        if prep_ocr.engine is None:
+            raise RuntimeError(prep_ocr.failed)
+
+        return prep_ocr.engine.Read( Value(last) )
+
+    last = "unwrap" if options.unwrap else "rotate"
+
+    # name : ( the stage it works on, how to compute it )
+    stages = {
+        "normalize" : ( None,
+                        lambda: prep_image.Normalize(
+                                    Timed( "decode", Decode ),
+                                    **params["normalize"] ) ),
+        "skew"      : ( "normalize",
+                        lambda: list( prep_image.EstimateSkew(
+                                          Value("normalize"),
+                                          **params["skew"] ) ) ),
+        "rotate"    : ( "skew",
+                        lambda: prep_image.Rotate( Value("normalize"),
+                                                   Value("skew")[0] ) ),
+        # The rotated image is squared up already. bucket isn't an argument,
+        # it is prep_geometry's own and only goes into the key
+        "unwrap"    : ( "rotate",
+                        lambda: prep_geometry.Unwrap(
+                                    Value("rotate"),
+                                    angle=0.,
+                                    inner=params["unwrap"]["inner"] ) ),
+        "ocr"       : ( last, OCR ) }
+
+    def Key(name):
+        """ A stage's cache key covers its parameters and those of every
+            stage before it. """
+        if name not in keys:
+            parent = stages[name][0]
+            keys[name] = prep_cache.Key( Key(parent) if parent else root,
+                                         name,
+                                         params.get(name) )
+        return keys[name]
+
+    def Value(name):
+        """ The result of a stage. A stage only asks for its input when it
+            isn't cached, so a hit skips everything before it. """
+        if name not in values:
+            compute = stages[name][1]
+
+            if cache is None:
+                values[name] = Timed( name, compute )
+            else:
+                # Not cache.hits: computing a stage can hit on its input
+                ran = []
+                def Compute():
+                    ran.append(name)
+                    return compute()
+
+                values[name] = Timed( name, lambda: cache.Stage( Key(name),
+                                                                 Compute ) )
+                if not ran: record["cached"].append(name)
+
+        return values[name]
+
+    try:
+        if cache is not None:
+            t0 = time.time()
+            root = prep_cache.FileHash(file_path)
+            record["times"]["hash"] = time.time() - t0
+
+        record["angle"], record["confidence"] = Value("skew")
+
+        if options.ocr: record["text"] = Value("ocr")
+        else:           Value(last)
+
+    except Exception as e:
+        record["error"] = "%s: %s" % ( type(e).__name__, e )
+
+    return record
+
+def WorkerInit(args):
+    """ Runs once in every pool worker. """
+    global cache, options
+    options = args
+
+    if options.cache is not None:
+        cache = prep_cache.StageCache(options.cache)
+
+    # One core per worker; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+    if options.ocr:
+        prep_ocr.WorkerInit( options.psm, options.lang, None )
+
+if __name__ == "__main__":
+    args = ArgParser()
+
+    files = FindFiles(args.inputs)
+    if not files:
+        print "No RAW files found"
+        sys.exit(1)
+
+    workers = args.workers or multiprocessing.cpu_count()
+    if verbose:
+        print "%i files, %i workers" % ( len(files), workers )
+        sys.stdout.flush()
+
+    if args.cache is not None:
+        cache = prep_cache.StageCache( args.cache,
+                                       int( args.cache_size * ( 1 << 20 ) ) )
+
+    out = sys.stdout if args.output == "-" else open( args.output, "w" )
+    pool = multiprocessing.Pool( workers, WorkerInit, ( args, ) )
+
+    t0 = time.time()
+    done = failures = hits = 0
+    try:
+        for record in pool.imap_unordered( ProcessFile, files ):
+            done += 1
+
+            # Written as they come in so an interrupted batch keeps what it
+            # finished
+            out.write( json.dumps(record) + "\n" )
+            out.flush()
+
+            failures += "error" in record
+            hits     += bool( record["cached"] )
+            if verbose and out is not sys.stdout:
+                print "[%i/%i] %s" % ( done, len(files), record["file"] )
+                sys.stdout.flush()
+
+            # Workers only ever add to the cache, evicting is done here
+            if cache is not None and done % trim_every == 0:
+                cache.Trim()
+
+        pool.close()
+
+    except KeyboardInterrupt:
+        pool.terminate()
+
+    pool.join()
+    if out is not sys.stdout: out.close()
+    if cache is not None: cache.Trim()
+
+    elapsed = time.time() - t0
+    sys.stderr.write( "%i files (%i failed, %i used the cache) in %.1fs: " \
+                      "%.2f files/s\n" % ( done,
+                                            failures,
+                                            hits,
+                                            elapsed,
+                                            done / elapsed ) )
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+    On disk, content addressed cache for the processing stages. Every stage
+    result is stored under a key made from the hash of the RAW file's
+    contents and the parameters of that stage and of all the stages before
+    it, so changing e.g. the OCR settings only changes the OCR keys and a
+    re-run picks everything up to the OCR from the cache. Renamed or copied
+    files still hit; edited ones don't.
+
+    Arrays are stored as .npy and come back memory mapped (read only), so a
+    hit costs little more than opening the file. Everything else is stored
+    as JSON. The cache is capped in size; the least recently used entries
+    are removed first.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import argparse
+import hashlib
+import json
+import numpy as np
+import os
+import tempfile
+import time
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+chunk_size = 1 << 20 # Bytes read at a time when hashing files
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class StageCache():
+    """ A directory of stage results keyed by Key. Stage is the main entry
+        point; Get and Put are there for values that don't fit it. Several
+        processes can share one cache: entries are written to a temporary
+        file and renamed into place, and Trim (which does the eviction) can
+        be called from any of them. """
+
+    def __init__(self, root, max_bytes=10 << 30):
+        self.hits      = 0
+        self.max_bytes = max_bytes
+        self.misses    = 0
+        self.root      = root
+
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def Entries(self):
+        """ (last use, size, path) of every entry. """
+        entries = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"): continue
+
+                path = os.path.join( directory, name )
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                entries.append( ( stat.st_mtime, stat.st_size, path ) )
+
+        return entries
+
+    def Get(self, key):
+        """ Return the value stored under key, or None. """
+        for ext in ( ".npy", ".json" ):
+            path = self.Path( key, ext )
+            try:
+                if ext == ".npy":
+                    value = np.load( path, mmap_mode='r' )
+                else:
+                    with open(path) as f:
+                        value = json.load(f)
+
+            except (IOError, OSError, ValueError):
+                continue
+
+            # The modification time doubles as the last use for Trim
+            try:
+                os.utime( path, None )
+            except OSError:
+                pass
+
+            return value
+
+        return None
+
+    def Path(self, key, ext):
+        # Two levels so no directory ends up with too many files in it
+        return os.path.join( self.root, key[:2], key + ext )
+
+    def Put(self, key, value):
+        """ Store value (a numpy array or anything JSON can take) under key.
+        """
+        ext = ".npy" if isinstance( value, np.ndarray ) else ".json"
+        path = self.Path( key, ext )
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass # Somebody else just made it
+
+        fd, tmp_path = tempfile.mkstemp( dir=directory, suffix=".tmp" )
+        try:
+            with os.fdopen( fd, "wb" ) as f:
+                if ext == ".npy":
+                    np.save( f, value )
+                else:
+                    json.dump( value, f )
+
+            try:
+                os.rename( tmp_path, path )
+            except OSError:
+                pass # Windows won't rename onto an existing file; somebody
+                     # else already stored the same thing
+
+        finally:
+            # Whatever went wrong (a full disk, a value JSON can't take),
+            # leave no half written file behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def Stage(self, key, compute):
+        """ Return the value stored under key, calling compute() and storing
+            its result if there is none. """
+        value = self.Get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.Put( key, value )
+
+        return value
+
+    def Trim(self, max_bytes=None):
+        """ Remove the least recently used entries until the cache is at most
+            max_bytes (the cap it was created with by default). Returns the
+            number of bytes freed. """
+        if max_bytes is None: max_bytes = self.max_bytes
+
+        entries = sorted( self.Entries() )
+        total = sum( size for _, size, _ in entries )
+        freed = 0
+
+        for _, size, path in entries:
+            if total - freed <= max_bytes: break
+
+            try:
+                os.remove(path)
+                freed += size
+
+            except OSError:
+                pass # In use (Windows) or already gone
+
+        return freed
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def ArgParser():
+    """ This function will handle the input arguments while keeping the main
+        function tidy. """
+
+    usage = """
+    prep_cache.py [--trim MB] DIR
+
+    Show how big a stage cache is, optionally trimming it down first.
+
+            """
+
+    parser = argparse.ArgumentParser( description = "Stage cache",
+                                      usage = usage)
+
+    parser.add_argument( "root",
+                         action  = "store",
+                         help    = "The cache directory." )
+
+    parser.add_argument( "--trim",
+                         action  = "store",
+                         default = None,
+                         dest    = "trim",
+                         type    = float,
+                         help    = "Trim the cache to this many MB." )
+
+    return parser.parse_args()
+
+def FileHash(file_path):
+    """ Return the SHA1 of the contents of a file. """
+    sha = hashlib.sha1()
+    with open( file_path, "rb" ) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk: break
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+def Key(parent, stage, params=None):
+    """ Return the key of a stage's result: parent is the key of the stage it
+        works on (or the file hash for the first stage), params a dict of
+        whatever changes its output. """
+    sha = hashlib.sha1(parent)
+    sha.update(stage)
+    sha.update( json.dumps( params or {}, sort_keys=True ) )
+
+    return sha.hexdigest()
+
+if __name__ == "__main__":
+    args = ArgParser()
+
+    cache = StageCache(args.root)
+    if args.trim is not None:
+        t0 = time.time()
+        freed = cache.Trim( int( args.trim * ( 1 << 20 ) ) )
+        print "Freed %.1f MB in %.2fs" % ( freed / float( 1 << 20 ),
+                                            time.time() - t0 )
+
+    entries = cache.Entries()
+    print "%i entries, %.1f MB" % ( len(entries),
+                                   sum( e[1] for e in entries ) /
+                                   float( 1 << 20 ) )
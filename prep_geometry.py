@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+    Geometry stage for the label captures: undo the rotation found by
+    prep_image.EstimateSkew and unwrap the circular label into a straight
+    strip (text running around the label ends up in rows) in a single
+    cv2.remap. Building the remap tables is most of the cost, and with the
+    camera on a stand every capture has the same size and label position, so
+    the tables are kept in a small LRU cache.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import collections
+import cv2
+import numpy as np
+
+import prep_image
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class RemapCache():
+    """ Least recently used cache of remap tables, holding at most size of
+        them (a full size unwrap table is about 50 MB). """
+
+    def __init__(self, size=4):
+        self.hits   = 0
+        self.maps   = collections.OrderedDict()
+        self.misses = 0
+        self.size   = size
+
+    def Clear(self):
+        self.maps.clear()
+
+    def Get(self, key, build):
+        """ Return the tables for key, calling build() to make them if they
+            aren't cached. """
+        if key in self.maps:
+            self.hits += 1
+            maps = self.maps.pop(key)
+
+        else:
+            self.misses += 1
+            maps = build()
+
+            if len(self.maps) >= self.size:
+                self.maps.popitem(last=False)
+
+        self.maps[key] = maps
+
+        return maps
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+bucket = 0.1 # Angles are rounded to this many degrees to share tables
+cache  = RemapCache()
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def LabelCircle(shape):
+    """ Where the label is expected in an image of the given shape: centered,
+        with a radius of 95% of half the height (the same circle the live
+        view overlay draws). """
+    height, width = shape[:2]
+
+    return ( width // 2, height // 2 ), int( height // 2 * 0.95 )
+
+def UnwrapMaps(center, radius, angle, inner=0.3):
+    """ Build the remap tables that unwrap the ring between inner * radius
+        and radius around center into a strip, rotated by angle degrees (in
+        the sense cv2.getRotationMatrix2D uses). The strip starts at 12
+        o'clock and runs clockwise; its top row is the outer edge so text
+        running around the label reads upright. It is as wide as the outer
+        circumference so nothing gets squeezed there. """
+    columns = int( round( 2 * np.pi * radius ) )
+    rows    = int( round( radius * ( 1 - inner ) ) )
+
+    # Rotating the image by angle is the same as starting the sweep angle
+    # further round
+    theta = np.linspace( -np.pi / 2, 1.5 * np.pi, columns, endpoint=False,
+                         dtype=np.float32 )
+    theta += np.float32( np.radians(angle) )
+    r = np.linspace( radius, inner * radius, rows, dtype=np.float32 )
+
+    map_x = np.outer( r, np.cos(theta) )
+    map_x += center[0]
+    map_y = np.outer( r, np.sin(theta) )
+    map_y += center[1]
+
+    # The fixed point form is smaller and remaps faster
+    return cv2.convertMaps( map_x, map_y, cv2.CV_16SC2 )
+
+def Unwrap(image, center=None, radius=None, angle=None, inner=0.3):
+    """ Deskew and unwrap the label in image into a strip (see UnwrapMaps).
+        center and radius default to LabelCircle; without an angle it is
+        estimated with prep_image.EstimateSkew. """
+    if center is None or radius is None:
+        center, radius = LabelCircle(image.shape)
+
+    if angle is None:
+        angle = prep_image.EstimateSkew(image)[0]
+
+    angle = round( angle / bucket ) * bucket
+    key = ( image.shape[:2], tuple(center), radius, angle, inner )
+
+    map1, map2 = cache.Get( key,
+                            lambda: UnwrapMaps( center, radius, angle, inner ) )
+
+    return cv2.remap( image, map1, map2, cv2.INTER_LINEAR )
@@ -8,9 +8,15 @@ import argparse
 import cv2
 import ctypes
 import numpy as np
+import os
+import shutil
+import subprocess as sp
 import sys
+import tempfile
 import time
 
+import prep_libraw # In process RAW decoding
+
 ###############################################################################
 ###                                                                         ###
 ###                             Global Variables                            ###
@@ -83,68 +89,227 @@ def ConvertRAW_TIFF(file_path):
 
     return 
 
-def Normalize(image, new_max=255):
-    min_i = np.min(image)
-    max_i = np.max(image)
-
-    image = (image-min_i) / float( max_i ) * new_max
-
-    return image.astype(np.uint8)
-
-def PrepImage(image):
-    i0 = cv2.Canny( image.copy(), 255, 255 )
-
-
-    lines = cv2.HoughLinesP( i0,
+def DecodeRAW(file_path):
+    """ Return the raw Bayer plane of a RAW file as a 16-bit image. LibRaw does
+        the decoding in this process; if the library can't be loaded we fall
+        back to running unprocessed_raw and reading its TIFF. """
+    try:
+        return prep_libraw.ReadBayer(file_path)
+
+    except OSError:
+        ConvertRAW_TIFF(file_path)
+
+        return cv2.imread( file_path + ".tiff", -1 )
+
+def DecodeRAWBuffer(data, name="capture.CR2"):
+    """ Same as DecodeRAW for a RAW file that is already in memory (e.g. from
+        CanonLiveView with in_memory set). Only the unprocessed_raw fallback
+        needs the data to take a trip through a scratch directory. """
+    try:
+        return prep_libraw.ReadBayerBuffer(data)
+
+    except OSError:
+        pass
+
+    tmp_dir = tempfile.mkdtemp()
+    file_path = os.path.join( tmp_dir, name )
+
+    try:
+        f = open( file_path, "wb" )
+        f.write(data)
+        f.close()
+
+        image = DecodeRAW(file_path)
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return image
+
+def EstimateSkew(image, levels=2, band=2., draw=False):
+    """ Estimate how far the straight edges in image (8-bit) are rotated away
+        from horizontal/vertical. Returns (angle, confidence): angle is in
+        degrees, in the sense cv2.getRotationMatrix2D takes to square the
+        image back up, and confidence is the share of the detected line
+        length that agrees with it (0 when no lines were found).
+
+        Lines are found on a level of the image pyramid (levels halvings
+        down) where Canny and Hough are cheap; the angle is then refined at
+        full resolution with a Hough transform that only looks within band
+        degrees of that first guess. With draw set a third value is returned:
+        a color copy of image with the lines drawn on it (green for the ones
+        that agree). """
+    gray = image if image.ndim == 2 else cv2.cvtColor( image,
+                                                       cv2.COLOR_BGR2GRAY )
+
+    small = gray
+    for i in range(levels):
+        small = cv2.pyrDown(small)
+    scale = 2 ** levels
+
+    # Slanted edges turn into short flat steps at low resolution, so only
+    # long segments give a usable angle down here
+    lines = cv2.HoughLinesP( cv2.Canny( small, 255, 255 ),
                              rho = 1,
                              theta = np.pi/180.,
-                             threshold = 80,
-                             minLineLength = 50,
-                             maxLineGap = 5 )[0]
-
-    num_lines = len(lines)
-
-    print "Found %i lines" % num_lines
-    sys.stdout.flush()
-
-    slopes = np.zeros(num_lines)
-    for i in range(num_lines):
-
-        dy = lines[i][3] - lines[i][1]
-        dx = lines[i][2] - lines[i][0]
-
-        if dx != 0: slopes[i] = np.arctan( dy / float(dx) ) / np.pi * 180.
-        else: slopes[i] = 0
-
-    i1 = im1.copy()
-    for i,line in enumerate(lines):
-        t0 = np.abs(slopes[i])
-
-        if t0 > 5 or t0 < 0.05:
-            cv2.line( i1, (line[0],line[1]), (line[2],line[3]), (0,255,0), 3 )
+                             threshold = 30,
+                             minLineLength = max( 160 // scale, 20 ),
+                             maxLineGap = 5 )
+
+    if lines is None:
+        result = ( 0., 0. )
+        if draw: result += ( cv2.cvtColor( gray, cv2.COLOR_GRAY2BGR ), )
+        return result
+
+    lines = lines.reshape( -1, 4 ) * scale
+    angles, lengths, vertical = LineAngles(lines)
+
+    # Length weighted histogram in half degree bins, the peak is our guess
+    hist, bins = np.histogram( angles,
+                               bins = 180,
+                               range = ( -45, 45 ),
+                               weights = lengths )
+    peak = ( bins[ np.argmax(hist) ] + bins[ np.argmax(hist) + 1 ] ) / 2.
+
+    agree = np.abs( angles - peak ) <= band
+    angle = np.average( angles[agree], weights=lengths[agree] )
+    confidence = lengths[agree].sum() / lengths.sum()
+
+    # Refine on the full resolution edges. Only horizontal lines are
+    # searched (theta = 90 + angle), so if most of the agreeing lines are
+    # vertical the edges are transposed, which turns angle into -angle.
+    edges = cv2.Canny( gray, 255, 255 )
+    flip = lengths[agree & vertical].sum() > lengths[agree & ~vertical].sum()
+    if flip:
+        edges = cv2.transpose(edges)
+        angle = -angle
+
+    found = cv2.HoughLines( edges,
+                            1,
+                            np.radians(0.05),
+                            max( 50, 2 * min( edges.shape ) // 10 ),
+                            srn = 0,
+                            stn = 0,
+                            min_theta = np.radians( 90 + angle - band ),
+                            max_theta = np.radians( 90 + angle + band ) )
+
+    if found is not None:
+        # Strongest lines come first
+        angle = np.median( np.degrees( found[:5, 0, 1] ) ) - 90
+
+    if flip: angle = -angle
+
+    result = ( float(angle), float(confidence) )
+
+    if draw:
+        drawing = cv2.cvtColor( gray, cv2.COLOR_GRAY2BGR )
+        for line, ok in zip( lines.astype(int), agree ):
+            cv2.line( drawing,
+                      ( line[0], line[1] ),
+                      ( line[2], line[3] ),
+                      ( 0, 255, 0 ) if ok else ( 0, 0, 255 ),
+                      3 )
+
+        cv2.putText( drawing,
+                     "%.3f (%.2f)" % result,
+                     ( 20, 60 ),
+                     cv2.FONT_HERSHEY_PLAIN,
+                     3,
+                     ( 0, 0, 255 ),
+                     2 )
+
+        result += ( drawing, )
+
+    return result
+
+def LineAngles(lines):
+    """ For an (N, 4) array of line segments (x0, y0, x1, y1) return their
+        angles in degrees folded into [-45, 45) so horizontal and vertical
+        edges of the same object agree, their lengths, and which of them are
+        closer to vertical than horizontal. """
+    dx = ( lines[:, 2] - lines[:, 0] ).astype(np.float64)
+    dy = ( lines[:, 3] - lines[:, 1] ).astype(np.float64)
+
+    angles = np.degrees( np.arctan2( dy, dx ) )
+    vertical = np.abs( np.abs( angles ) - 90 ) < 45
+
+    return ( angles + 45 ) % 90 - 45, np.hypot( dx, dy ), vertical
+
+def Limits(image, clip=None, step=8):
+    """ Return the (low, high) values to stretch image between. Without clip
+        that is the min and max of the whole image. clip=(lo, hi) gives
+        percentiles instead, read off a histogram of every step-th pixel in
+        both directions which is plenty to place them. """
+    if clip is None:
+        if image.ndim == 2:
+            low, high, _, _ = cv2.minMaxLoc(image)
+            return low, high
+
+        return image.min(), image.max()
+
+    sample = image[::step, ::step].ravel()
+
+    if sample.dtype.kind != 'u':
+        low, high = np.percentile( sample, clip )
+        return low, high
+
+    hist = np.bincount( sample, minlength=int( sample.max() ) + 1 )
+    cdf = np.cumsum(hist)
+
+    low  = np.searchsorted( cdf, cdf[-1] * clip[0] / 100., side="right" )
+    high = np.searchsorted( cdf, cdf[-1] * clip[1] / 100., side="left" )
+
+    return int(low), int( max( high, low ) )
+
+def Normalize(image, new_max=255, clip=None, out=None):
+    """ Stretch image so (low, high) from Limits maps to (0, new_max) and
+        return it as uint8. The scale, offset, saturation and conversion to
+        uint8 all happen in one pass straight into out, so there are no full
+        size temporaries; pass out (a uint8 array the shape of image) to skip
+        the output allocation as well. """
+    low, high = Limits( image, clip )
+    scale = new_max / float( high - low or 1 )
+
+    if out is None:
+        out = np.empty( image.shape, np.uint8 )
+
+    # out = saturate( image * scale - low * scale ); the second input gets a
+    # weight of zero, this is just the one OpenCV call that scales with a
+    # saturating cast to uint8 and takes a destination
+    cv2.addWeighted( image, scale, image, 0, -low * scale,
+                     dst=out, dtype=cv2.CV_8U )
+
+    if new_max < 255:
+        np.minimum( out, new_max, out=out )
+
+    return out
+
+def PrepImage(image, draw=False):
+    """ Square image up: estimate its skew and rotate it back. Returns the
+        rotated image, the angle and the confidence from EstimateSkew, plus
+        the line drawing when draw is set. """
+    result = EstimateSkew( image, draw=draw )
+    angle = result[0]
+
+    if verbose:
+        print "Skew %.3f degrees (confidence %.2f)" % ( angle, result[1] )
+        sys.stdout.flush()
 
-            cv2.putText( i1,
-                         "%.4f" % slopes[i],
-                         (line[0],line[1]),
-                         cv2.FONT_HERSHEY_PLAIN,
-                         3,
-                         (0,0,255),
-                         2 )
+    return ( Rotate( image, angle ), ) + result
 
-    print slopes
-    sys.stdout.flush()
+def PrepRAW(data, name="capture.CR2"):
+    """ Decode and normalize a RAW file held in memory. """
+    return Normalize( DecodeRAWBuffer( data, name ) )
 
-    # i_small = cv2.resize( i1,
-    #                       None,
-    #                       fx=0.25,
-    #                       fy=0.25,
-    #                       interpolation=cv2.INTER_NEAREST )
-    # 4032 3024
-    # cv2.imshow("i0", i1[756:2268,1008:3024])
-    # cv2.waitKey(0)
+def Rotate(image, angle):
+    """ Rotate image by angle degrees about its center, keeping its size. """
+    height, width = image.shape[:2]
+    rotation = cv2.getRotationMatrix2D( ( width / 2., height / 2. ),
+                                        angle,
+                                        1. )
 
-    # cv2.imwrite(DIR + "temp.png", i1)
-    return i1
+    return cv2.warpAffine( image, rotation, ( width, height ),
+                           flags=cv2.INTER_LINEAR )
 
 def Timer(text="Segment"):
     """ Use for evaluating performance. Call in pairs to print out elapsed
@@ -167,18 +332,13 @@ def Timer(text="Segment"):
 if __name__ == "__main__":
     ArgParser()
 
-    # ConvertRAW_TIFF(r_image)
-
-    im0 = cv2.imread( t_image, -1 )
+    im0 = DecodeRAW(r_image)
 
     out_image = Normalize(im0)
 
-    # im1 = np.rot90(im0,k=2)
-
-    # im1 = cv2.cvtColor(im0, cv2.cv.CV_BGR2GRAY)
-
-    # out_image = PrepImage( im1 )
-    # RotateImage(im0)
+    # Show the detected lines instead of the squared image when debugging
+    result = PrepImage( out_image, draw=debug )
+    out_image = result[-1] if debug else result[0]
 
     out_image = cv2.resize( out_image,
                         None,
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+    ctypes binding to the parts of the LibRaw C API we need to get at the
+    raw sensor data: open a file or a buffer, unpack it and look at the
+    Bayer values directly as a numpy array. This replaces running
+    libraw/unprocessed_raw.exe and reading back the TIFF it writes.
+
+    The C API has no accessor for the unpacked sensor data (rawdata.raw_image)
+    and libraw_raw2image would copy it into a 4 channel image four times its
+    size, so we find the pointer in libraw_data_t ourselves; see
+    RawImageOffset.
+
+    Uses libraw/libraw.dll on Windows and the system libraw.so elsewhere.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import ctypes
+import ctypes.util
+import numpy as np
+import os
+import sys
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+lib = None # The loaded library, see LoadLibRaw
+
+raw_image_offset = None # Of rawdata.raw_image in libraw_data_t, once found
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class ImageSizes(ctypes.Structure):
+    """ The start of libraw_image_sizes_t, laid out the same from LibRaw
+        0.18 (libraw/libraw.dll) on. It follows the image pointer in
+        libraw_data_t and libraw_unpack saves a copy of it in rawdata. """
+    _fields_ = [ ( "raw_height",  ctypes.c_ushort ),
+                 ( "raw_width",   ctypes.c_ushort ),
+                 ( "height",      ctypes.c_ushort ),
+                 ( "width",       ctypes.c_ushort ),
+                 ( "top_margin",  ctypes.c_ushort ),
+                 ( "left_margin", ctypes.c_ushort ),
+                 ( "iheight",     ctypes.c_ushort ),
+                 ( "iwidth",      ctypes.c_ushort ),
+                 ( "raw_pitch",   ctypes.c_uint ) ] # In bytes
+
+class LibRawError(Exception):
+    """ A LibRaw call returned an error code. """
+
+    def __init__(self, call, code):
+        self.call = call
+        self.code = code
+
+        message = lib.libraw_strerror(code) if lib is not None else ""
+        Exception.__init__( self, "%s failed (%i): %s" % ( call,
+                                                           code,
+                                                           message ) )
+
+
+class LibRaw():
+    """ One LibRaw processor. Open a file or buffer, Unpack it and then use
+        Image/Plane/Bayer to get at the sensor values. Arrays returned by
+        Image and Plane point into LibRaw's own memory so they are only good
+        until the next Open or Close; Bayer copies, once. Use it as a context
+        manager or call Close when done. """
+
+    def __init__(self):
+        LoadLibRaw()
+
+        self.buffer = None # LibRaw reads from a buffer without copying it
+        self.handle = lib.libraw_init(0)
+        self.image  = None # view over the visible part of the raw data
+
+        if not self.handle:
+            raise LibRawError( "libraw_init", -7 ) # out of memory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+    def Bayer(self, out=None):
+        """ Return a copy of the Bayer mosaic, as a 2-D uint16 array that
+            outlives this processor. The one copy goes into out (allocated if
+            not given, reuse it to avoid the allocation). """
+        image = self.Image()
+
+        if out is None:
+            return image.copy()
+
+        np.copyto( out, image )
+
+        return out
+
+    def Check(self, call, code):
+        if code != 0:
+            raise LibRawError( call, code )
+
+    def Close(self):
+        if self.handle:
+            lib.libraw_close(self.handle)
+
+        self.buffer = None
+        self.handle = None
+        self.image  = None
+
+    def Image(self):
+        """ The Bayer mosaic as a (height, width) uint16 view of LibRaw's
+            unpacked raw data, without copying; the masked border around the
+            visible area is sliced off. """
+        return self.image
+
+    def Open(self, file_path):
+        lib.libraw_recycle(self.handle)
+        self.buffer = None
+        self.image  = None
+
+        self.Check( "libraw_open_file",
+                    lib.libraw_open_file( self.handle, file_path ) )
+
+    def OpenBuffer(self, data):
+        """ Open a RAW file that is already in memory (a string or anything
+            else with the buffer interface). """
+        lib.libraw_recycle(self.handle)
+        self.image = None
+
+        # A view, not a copy; holding on to it keeps data alive for LibRaw
+        self.buffer = np.frombuffer( data, np.uint8 )
+
+        self.Check( "libraw_open_buffer",
+                    lib.libraw_open_buffer( self.handle,
+                                            self.buffer.ctypes.data,
+                                            self.buffer.nbytes ) )
+
+    def Plane(self, row, col):
+        """ The values of one site of the 2x2 color filter pattern (row and
+            col are 0 or 1) as a half size 2-D view, no copying. """
+        return self.Image()[row::2, col::2]
+
+    def Sites(self):
+        """ Map each (row, col) of the 2x2 color filter pattern to its color
+            (0 red, 1 green, 2 blue, 3 the second green). """
+        return dict( ( (row, col), lib.libraw_COLOR( self.handle, row, col ) )
+                     for row in (0, 1) for col in (0, 1) )
+
+    def Unpack(self):
+        """ Unpack the sensor data and map it for Image, without copying.
+            Only Bayer files have it; anything else (sRAW, Foveon, ...)
+            raises LibRawError. """
+        self.Check( "libraw_unpack", lib.libraw_unpack(self.handle) )
+
+        # sizes follows the image pointer at the start of libraw_data_t
+        sizes = ImageSizes.from_address( self.handle +
+                                         ctypes.sizeof(ctypes.c_void_p) )
+
+        offset = RawImageOffset( self.handle, sizes )
+        if offset is None:
+            raise LibRawError( "libraw_unpack", -2 ) # unsupported file
+
+        pixels = ctypes.POINTER(ctypes.c_ushort).from_address( self.handle +
+                                                               offset )
+        if not pixels:
+            raise LibRawError( "libraw_unpack", -2 )
+
+        raw = np.ctypeslib.as_array( pixels,
+                                     shape=( sizes.raw_height,
+                                             sizes.raw_pitch // 2 ) )
+
+        self.image = raw[ sizes.top_margin:sizes.top_margin + sizes.height,
+                          sizes.left_margin:sizes.left_margin + sizes.width ]
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def LoadLibRaw(lib_path=None):
+    """ Load the LibRaw shared library (once) and declare the prototypes of
+        the functions we use. """
+    global lib
+    if lib is not None: return lib
+
+    if lib_path is None:
+        if sys.platform == "win32":
+            lib_path = os.path.join( os.path.dirname(os.path.abspath(__file__)),
+                                     "libraw",
+                                     "libraw.dll" )
+        else:
+            lib_path = ctypes.util.find_library("raw") or "libraw.so"
+
+    dll = ctypes.CDLL(lib_path)
+
+    handle = ctypes.c_void_p
+    prototypes = { "libraw_init"         : ( handle, [ctypes.c_uint] ),
+                   "libraw_open_file"    : ( ctypes.c_int,
+                                             [handle, ctypes.c_char_p] ),
+                   "libraw_open_buffer"  : ( ctypes.c_int,
+                                             [handle,
+                                              ctypes.c_void_p,
+                                              ctypes.c_size_t] ),
+                   "libraw_unpack"       : ( ctypes.c_int, [handle] ),
+                   "libraw_COLOR"        : ( ctypes.c_int,
+                                             [handle,
+                                              ctypes.c_int,
+                                              ctypes.c_int] ),
+                   "libraw_recycle"      : ( None, [handle] ),
+                   "libraw_close"        : ( None, [handle] ),
+                   "libraw_strerror"     : ( ctypes.c_char_p, [ctypes.c_int] ),
+                   "libraw_version"      : ( ctypes.c_char_p, [] ) }
+
+    for name, ( restype, argtypes ) in prototypes.iteritems():
+        func = getattr( dll, name )
+        func.restype  = restype
+        func.argtypes = argtypes
+
+    lib = dll
+
+    return lib
+
+def RawImageOffset(handle, sizes, chunk=0x10000, limit=0x100000):
+    """ Find the offset of rawdata.raw_image in libraw_data_t (handle) once
+        a Bayer file is unpacked, and remember it. None if it isn't there,
+        which is the case for files without Bayer data.
+
+        Where rawdata lies depends on the LibRaw version, so we look for it:
+        libraw_unpack saves a copy of sizes in rawdata, right after
+        iparams, and rawdata starts with the pointers raw_alloc and raw_image
+        (the same buffer for a Bayer file) followed by the five other image
+        pointers (all NULL). Reading in chunks never runs past the end of
+        the struct, as the 128 KB colordata follows the sizes copy. """
+    global raw_image_offset
+    if raw_image_offset is not None: return raw_image_offset
+
+    pointer = ctypes.sizeof(ctypes.c_void_p)
+    key = ctypes.string_at( ctypes.addressof(sizes), ctypes.sizeof(sizes) )
+
+    # The copy of sizes, past the original
+    data = ""
+    found = -1
+    while found < 0 and len(data) < limit:
+        data += ctypes.string_at( handle + len(data), chunk )
+        found = data.find( key, pointer + len(key) )
+
+    if found < 0: return None
+
+    # The start of rawdata, at most a few KB (iparams) before it
+    words = np.frombuffer( data[:found - found % pointer],
+                           np.uint32 if pointer == 4 else np.uint64 )
+
+    for i in xrange( len(words) - 7, max( -1, len(words) - 1024 ), -1 ):
+        if words[i] and words[i] == words[i + 1] and \
+           not words[i + 2:i + 7].any():
+            raw_image_offset = ( i + 1 ) * pointer
+            break
+
+    return raw_image_offset
+
+def ReadBayer(source, out=None):
+    """ Decode a RAW file and return its Bayer mosaic as a 2-D uint16 array.
+    """
+    with LibRaw() as raw:
+        raw.Open(source)
+        raw.Unpack()
+
+        return raw.Bayer(out)
+
+def ReadBayerBuffer(data, out=None):
+    """ Same as ReadBayer for a RAW file that is already in memory. """
+    with LibRaw() as raw:
+        raw.OpenBuffer(data)
+        raw.Unpack()
+
+        return raw.Bayer(out)
+
+if __name__ == "__main__":
+    LoadLibRaw()
+    print "LibRaw %s" % lib.libraw_version()
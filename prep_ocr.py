@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+"""
+    Tesseract OCR stage. Starting tesseract (and loading its language data)
+    for every image costs more than reading a label, so OCRPool keeps a set
+    of worker processes that each hold one Tesseract engine for their whole
+    life and feeds them uint8 images straight from Normalize/PrepImage.
+
+    The engine is the Tesseract C API through ctypes. If the library can't be
+    found the tesseract command line is used instead, in its list mode: the
+    pool hands each worker batches of images and one tesseract process reads
+    a whole batch, so the start up cost is paid per batch instead of per
+    image. It is still slower than the library, so the pool says so.
+"""
+###############################################################################
+###                                                                         ###
+###                                 Imports                                 ###
+###                                                                         ###
+###############################################################################
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import cv2
+import multiprocessing
+import numpy as np
+import os
+import re
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+###############################################################################
+###                                                                         ###
+###                             Global Variables                            ###
+###                                                                         ###
+###############################################################################
+cli_batch = 8 # Images per tesseract process when there is no library
+engine  = None # The Tesseract engine of this (worker) process
+failed  = None # or why it couldn't be started
+lang    = "eng"
+psm     = 3    # Page segmentation mode, 3 is tesseract's fully automatic
+verbose = False
+
+# One per image: job is whatever id the caller gave it, latency is from
+# submission to the result coming back and ocr_time the part of that spent
+# in Tesseract
+OCRResult = collections.namedtuple( "OCRResult",
+                                    "job text latency ocr_time error" )
+
+###############################################################################
+###                                                                         ###
+###                                 Classes                                 ###
+###                                                                         ###
+###############################################################################
+
+class TessAPI():
+    """ A Tesseract engine through the C API. Initialized once, then Read can
+        be called for as many images as needed. """
+
+    # Library names Tesseract has shipped under
+    names = [ "tesseract", "libtesseract-4", "libtesseract-3",
+              "libtesseract305" ]
+
+    def __init__(self, psm=psm, lang=lang, datapath=None):
+        path = LibraryPath()
+        if path is None:
+            raise OSError( "Tesseract library not found" )
+
+        self.lib = ctypes.CDLL(path)
+
+        handle = ctypes.c_void_p
+        prototypes = {
+            "TessBaseAPICreate"         : ( handle, [] ),
+            "TessBaseAPIInit3"          : ( ctypes.c_int,
+                                            [handle,
+                                             ctypes.c_char_p,
+                                             ctypes.c_char_p] ),
+            "TessBaseAPISetPageSegMode" : ( None, [handle, ctypes.c_int] ),
+            "TessBaseAPISetImage"       : ( None,
+                                            [handle,
+                                             ctypes.c_void_p,
+                                             ctypes.c_int,
+                                             ctypes.c_int,
+                                             ctypes.c_int,
+                                             ctypes.c_int] ),
+            "TessBaseAPIGetUTF8Text"    : ( ctypes.c_void_p, [handle] ),
+            "TessDeleteText"            : ( None, [ctypes.c_void_p] ),
+            "TessBaseAPIClear"          : ( None, [handle] ),
+            "TessBaseAPIEnd"            : ( None, [handle] ),
+            "TessBaseAPIDelete"         : ( None, [handle] ) }
+
+        for name, ( restype, argtypes ) in prototypes.iteritems():
+            func = getattr( self.lib, name )
+            func.restype  = restype
+            func.argtypes = argtypes
+
+        self.handle = self.lib.TessBaseAPICreate()
+        if self.lib.TessBaseAPIInit3( self.handle, datapath, lang ) != 0:
+            raise OSError( "Tesseract couldn't load language %s" % lang )
+
+        self.lib.TessBaseAPISetPageSegMode( self.handle, psm )
+
+    def Close(self):
+        if self.handle:
+            self.lib.TessBaseAPIEnd(self.handle)
+            self.lib.TessBaseAPIDelete(self.handle)
+            self.handle = None
+
+    def Read(self, image):
+        """ Return the text in image (a uint8 numpy array, gray or BGR). """
+        image = np.ascontiguousarray(image)
+        depth = 1 if image.ndim == 2 else image.shape[2]
+
+        self.lib.TessBaseAPISetImage( self.handle,
+                                      image.ctypes.data,
+                                      image.shape[1],
+                                      image.shape[0],
+                                      depth,
+                                      image.strides[0] )
+
+        text = self.lib.TessBaseAPIGetUTF8Text(self.handle)
+        try:
+            return ctypes.string_at(text).decode("utf-8")
+
+        finally:
+            self.lib.TessDeleteText(text)
+            self.lib.TessBaseAPIClear(self.handle)
+
+
+class TessCLI():
+    """ The fallback engine: the tesseract command line. Read starts a
+        process for one image, ReadMany one for a whole list of them. """
+
+    def __init__(self, psm=psm, lang=lang, datapath=None):
+        # 3.x spells the page segmentation option -psm, 4 and up --psm
+        o, e = sp.Popen( ["tesseract", "--version"],
+                         stdout=sp.PIPE,
+                         stderr=sp.PIPE ).communicate()
+        version = re.search( r"tesseract\s+(\d+)", o + e )
+        psm_flag = "-psm" if version and int( version.group(1) ) < 4 \
+                   else "--psm"
+
+        self.options = [ "-l", lang, psm_flag, str(psm) ]
+        if datapath is not None:
+            self.options += [ "--tessdata-dir", datapath ]
+
+    def Close(self):
+        pass
+
+    def Read(self, image):
+        _, png = cv2.imencode( ".png", image )
+        o, e = sp.Popen( [ "tesseract", "stdin", "stdout" ] + self.options,
+                         stdin=sp.PIPE,
+                         stdout=sp.PIPE,
+                         stderr=sp.PIPE ).communicate( png.tostring() )
+
+        return o.decode("utf-8")
+
+    def ReadMany(self, images):
+        """ Return the text in each of images with a single tesseract run:
+            given a text file listing image files it reads them all and
+            ends the text of each with a form feed. """
+        tmp_dir = tempfile.mkdtemp( prefix="ocr" )
+        try:
+            paths = []
+            for i, image in enumerate(images):
+                paths.append( os.path.join( tmp_dir, "%06i.png" % i ) )
+                cv2.imwrite( paths[-1], image )
+
+            list_path = os.path.join( tmp_dir, "images.txt" )
+            with open( list_path, "w" ) as f:
+                f.write( "\n".join(paths) + "\n" )
+
+            o, e = sp.Popen( [ "tesseract", list_path, "stdout" ] + \
+                             self.options,
+                             stdout=sp.PIPE,
+                             stderr=sp.PIPE ).communicate()
+
+        finally:
+            shutil.rmtree( tmp_dir, ignore_errors=True )
+
+        pages = o.decode("utf-8").split(u"\f")
+        if len(pages) < len(images):
+            raise RuntimeError( "tesseract read %i of %i images: %s" % (
+                                len(pages) - 1, len(images), e.strip() ) )
+
+        return pages[:len(images)]
+
+
+class OCRPool():
+    """ A pool of worker processes with one persistent Tesseract engine
+        each. Map sends jobs out, batch at a time per worker, and hands back
+        OCRResults in the order they finish. batch is 1 with the library and
+        cli_batch without it, unless given. """
+
+    def __init__(self, workers=None, psm=psm, lang=lang, datapath=None,
+                 batch=None):
+        if LibraryPath() is None:
+            sys.stderr.write( "Tesseract library not found, running the " \
+                              "tesseract command line instead (slower)\n" )
+            self.batch = batch or cli_batch
+        else:
+            self.batch = batch or 1
+
+        workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool( workers,
+                                          WorkerInit,
+                                          ( psm, lang, datapath ) )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+    def Close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def Map(self, jobs, chunksize=1):
+        """ jobs is an iterable of (job id, uint8 image). Yields an OCRResult
+            per job as soon as it is done, in whatever order that is. Job ids
+            don't have to be unique. """
+        submitted = {} # index : ( job id, time submitted )
+
+        def Submit():
+            batch = []
+            for index, ( job, image ) in enumerate(jobs):
+                submitted[index] = ( job, time.time() )
+                batch.append( ( index, image ) )
+
+                if len(batch) == self.batch:
+                    yield batch
+                    batch = []
+
+            if batch: yield batch
+
+        results = self.pool.imap_unordered( WorkerRead, Submit(), chunksize )
+        for batch in results:
+            for index, text, ocr_time, error in batch:
+                job, t_submitted = submitted.pop(index)
+                yield OCRResult( job,
+                                 text,
+                                 time.time() - t_submitted,
+                                 ocr_time,
+                                 error )
+
+###############################################################################
+###                                                                         ###
+###                                Functions                                ###
+###                                                                         ###
+###############################################################################
+def ArgParser():
+    """ This function will handle the input arguments while keeping the main
+        function tidy. """
+
+    usage = """
+    prep_ocr.py [-j N] [--psm N] [-l LANG] IMAGE ...
+
+    OCR image files with a pool of Tesseract workers, printing each result
+    as it comes in.
+
+            """
+
+    parser = argparse.ArgumentParser( description = "Tesseract OCR pool",
+                                      usage = usage)
+
+    parser.add_argument( "files",
+                         nargs   = '+',
+                         action  = "store",
+                         help    = "The image files to read." )
+
+    parser.add_argument( "-j",
+                         action  = "store",
+                         default = None,
+                         dest    = "workers",
+                         type    = int,
+                         help    = "Number of workers (default one per " \
+                                   "core)." )
+
+    parser.add_argument( "-l",
+                         action  = "store",
+                         default = lang,
+                         dest    = "lang",
+                         help    = "Tesseract language." )
+
+    parser.add_argument( "--psm",
+                         action  = "store",
+                         default = psm,
+                         dest    = "psm",
+                         type    = int,
+                         help    = "Tesseract page segmentation mode." )
+
+    parser.add_argument( "-v",
+                         action  = "store_const",
+                         const   = True,
+                         default = False,
+                         dest    = "verbose",
+                         help    = "Make this script a chatterbox." )
+
+    args = parser.parse_args()
+
+    global verbose
+    verbose = args.verbose
+
+    return args
+
+def Engine(psm=psm, lang=lang, datapath=None):
+    """ The best Tesseract engine available: the C API, or the command line
+        if the library isn't there. """
+    try:
+        return TessAPI( psm, lang, datapath )
+
+    except OSError:
+        return TessCLI( psm, lang, datapath )
+
+def LibraryPath():
+    """ Where the Tesseract library is, or None if it can't be found. """
+    for name in TessAPI.names:
+        path = ctypes.util.find_library(name)
+        if path is not None:
+            return path
+
+    return None
+
+def WorkerInit(psm, lang, datapath):
+    """ Runs once in every pool worker: start its engine. A failure is kept
+        and reported with every job; raising here would only get the worker
+        restarted over and over. """
+    global engine, failed
+    try:
+        engine = Engine( psm, lang, datapath )
+
+    except Exception as e:
+        failed = "%s: %s" % ( type(e).__name__, e )
+
+def WorkerRead(batch):
+    """ Runs in a pool worker for every batch of (index, image). Returns
+        (index, text, seconds in tesseract, error) for each. Exceptions are
+        passed back as text so one bad image doesn't take the pool down. """
+    if engine is None:
+        return [ ( index, None, 0., failed ) for index, _ in batch ]
+
+    if len(batch) > 1 and hasattr( engine, "ReadMany" ):
+        t0 = time.time()
+        try:
+            texts = engine.ReadMany( [ image for _, image in batch ] )
+            ocr_time = ( time.time() - t0 ) / len(batch)
+
+            return [ ( index, text, ocr_time, None )
+                     for ( index, _ ), text in zip( batch, texts ) ]
+
+        except Exception:
+            pass # Read them one by one to find the one that fails
+
+    results = []
+    for index, image in batch:
+        t0 = time.time()
+        try:
+            text = engine.Read(image)
+            error = None
+
+        except Exception as e:
+            text = None
+            error = "%s: %s" % ( type(e).__name__, e )
+
+        results.append( ( index, text, time.time() - t0, error ) )
+
+    return results
+
+if __name__ == "__main__":
+    args = ArgParser()
+
+    def Jobs():
+        for file_path in args.files:
+            yield file_path, cv2.imread( file_path, cv2.IMREAD_GRAYSCALE )
+
+    t0 = time.time()
+    with OCRPool( args.workers, args.psm, args.lang ) as pool:
+        for result in pool.Map( Jobs() ):
+            print "%s (%.2fs, %.2fs in tesseract)" % ( result.job,
+                                                       result.latency,
+                                                       result.ocr_time )
+            if result.error is not None:
+                print "    %s" % result.error
+            else:
+                print result.text.encode("utf-8")
+
+            sys.stdout.flush()
+
+    if verbose:
+        print "%i images in %.1fs" % ( len(args.files), time.time() - t0 )